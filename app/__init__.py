@@ -1,27 +1,71 @@
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
-from dotenv import load_dotenv
+from app.database import engine_options, sqlite_pragmas, configure_sqlite
 
-load_dotenv()
-app = Flask(__name__)
-basedir = os.path.abspath(os.path.dirname(__file__)) # get absolute path of the current file
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')  # secret key
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'products.db') # locate products database
-db = SQLAlchemy(app) # initalise db
-migrate = Migrate(app, db) # initalise migrate
+# the app is built by create_app(config), importing the package only sets up the extensions and models can be
+# used without an app. The route modules are imported by the factory, so scripts that only need the models
+# (benchmarks, migrations) skip them, and startup does no schema work: a new database gets its tables from
+# `flask db upgrade` or `flask create-db`. main.py (gunicorn main:app) and asgi.py build the app once per process,
+# the flask command finds create_app on its own
+
+db = SQLAlchemy() # initalise db, bound to the app by create_app
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
 
+basedir = os.path.abspath(os.path.dirname(__file__)) # get absolute path of the current file
 ALLOWED_EXTENSIONS = set(['txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif']) # allow what extentions to be uploaded
-app.config['UPLOAD_FOLDER'] = os.path.realpath('.') + '/app/static/images' # tell flask where to put images
 
-# Flask-Login initialisation
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+def create_app(config=None):
+    # config overrides the settings read from the environment (and .env)
+    from dotenv import load_dotenv
+    load_dotenv()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')  # secret key
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'products.db') # locate products database, DATABASE_URL can point anywhere else (e.g. postgresql://...)
+    app.config['SQLITE_PRAGMAS'] = sqlite_pragmas() # WAL, busy timeout and cache settings applied to every new SQLite connection
+    app.config['UPLOAD_FOLDER'] = os.path.realpath('.') + '/app/static/images' # tell flask where to put images
+    app.config['PRODUCT_COUNT_TTL'] = int(os.getenv('PRODUCT_COUNT_TTL', 60)) # seconds to cache the total product count for, 0 to always count
+    app.config['CATALOG_CACHE_SIZE'] = int(os.getenv('CATALOG_CACHE_SIZE', 1024)) # max entries in the in-process catalog cache
+    app.config['CATALOG_CACHE_TTL'] = int(os.getenv('CATALOG_CACHE_TTL', 300)) # seconds before a cached catalog entry is reloaded
+    app.config['CATALOG_CACHE_BACKEND'] = os.getenv('CATALOG_CACHE_BACKEND') # optional 'module:Class' shared cache backend
+    app.config['PRODUCT_SAMPLING'] = os.getenv('PRODUCT_SAMPLING', 'pool') # 'pool' picks homepage products by id, 'sql' uses ORDER BY random()
+    app.config['IMAGE_VARIANT_WIDTHS'] = os.getenv('IMAGE_VARIANT_WIDTHS', '320,640') # widths of the resized copies used in product grids
+    app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', 2)) # background threads making image variants
+    app.config['IMAGE_QUALITY'] = int(os.getenv('IMAGE_QUALITY', 80)) # WebP and JPEG quality of the variants
+    app.config['PAGE_CACHE_TTL'] = int(os.getenv('PAGE_CACHE_TTL', 60)) # seconds a rendered catalog page or product card is kept, 0 to turn page caching off
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 30)) # seconds the logged in user is kept between database reads, 0 reads it on every request
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt') # werkzeug hash method and cost, e.g. 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'
+    app.config['PASSWORD_SALT_LENGTH'] = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 0)) # max password hashes running at once per worker, 0 hashes on the request thread
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '0') == '1' # per route latency, SQL and template timings served on /metrics
+    app.config['SLOW_QUERY_MS'] = int(os.getenv('SLOW_QUERY_MS', 0)) # log statements slower than this many milliseconds, 0 to turn off
+    app.config['MAINTENANCE_INTERVAL'] = int(os.getenv('MAINTENANCE_INTERVAL', 0)) # seconds between in process maintenance runs, 0 leaves it to `flask maintenance run`
+    app.config['MAINTENANCE_MAX_SECONDS'] = float(os.getenv('MAINTENANCE_MAX_SECONDS', 30)) # time budget for the purges of one run
+    app.config['CART_PURGE_BATCH'] = int(os.getenv('CART_PURGE_BATCH', 1000)) # rows deleted per statement and commit
+    app.config['CART_STALE_DAYS'] = int(os.getenv('CART_STALE_DAYS', 30)) # carts untouched this long are purged with their items
+    app.config['EMPTY_CART_HOURS'] = int(os.getenv('EMPTY_CART_HOURS', 24)) # empty carts untouched this long are purged, at least 1
+    app.config['VACUUM_PAGES'] = int(os.getenv('VACUUM_PAGES', 2000)) # free SQLite pages handed back per run
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI'])) # connection pool settings
+
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+    from flask_migrate import Migrate
+    Migrate(app, db, render_as_batch=True) # flask db, batch mode lets alembic alter SQLite tables
+    login_manager.init_app(app)
 
-from app import routes # get routes or endpoints
+    from app import routes, api, assets, cli
+    for blueprint in routes.blueprints: # storefront, cart, login and admin pages
+        app.register_blueprint(blueprint)
+    app.register_blueprint(api.api_v1) # JSON API under /api/v1
+    assets.init_assets(app) # fingerprinted, long cached static files
+    cli.init_cli(app) # flask catalog import/export/recount, flask create-db
 
-with app.app_context():
-    db.create_all()
\ No newline at end of file
+    from app.metrics import init_metrics
+    init_metrics(app) # hooks nothing up unless METRICS_ENABLED or SLOW_QUERY_MS is set
+    from app.maintenance import init_maintenance
+    init_maintenance(app) # with MAINTENANCE_INTERVAL set, each worker starts a maintenance thread on its first request
+    return app
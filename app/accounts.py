@@ -0,0 +1,131 @@
+import csv
+import io
+from app import db
+from app.identity import forget_users
+from app.models import User, Cart, CartItem, normalize_name
+
+# admin user management: the user list, its CSV export and bulk actions, none of which loads User objects.
+# the list is keyset paginated over an index for every sort order (ix_user_username_key, ix_user_admin and the
+# primary key), so page 500 costs the same as page 1, and the export streams rows in batches.
+# bulk promote, demote and delete are single UPDATE/DELETE statements run in one transaction, either for
+# the picked ids or for every user matching the list filter, and deleting also removes the users' carts and items
+
+USER_SORTS = {
+    'id': (User.id,),
+    'username': (User.username_key, User.id),
+    'admin': (User.admin, User.id)
+}
+BULK_ACTIONS = ('promote', 'demote', 'delete')
+MAX_PAGE_SIZE = 200
+
+def listing_options(args):
+    # sort, direction and filters from the query string (or a bulk form), unknown values fall back to the defaults
+    sort = args.get('sort', 'id')
+    direction = args.get('direction', 'asc')
+    role = args.get('role', '')
+    return {
+        'sort': sort if sort in USER_SORTS else 'id',
+        'direction': direction if direction in ('asc', 'desc') else 'asc',
+        'query': args.get('q', '').strip(),
+        'role': role if role in ('admin', 'customer') else ''
+    }
+
+def listing_args(options):
+    # the options as query string arguments for url_for, defaults left out
+    args = {'sort': options['sort'], 'direction': options['direction'], 'q': options['query'], 'role': options['role']}
+    defaults = {'sort': 'id', 'direction': 'asc', 'q': '', 'role': ''}
+    return {key: value for key, value in args.items() if value != defaults[key]}
+
+def user_filters(query='', role=''):
+    filters = []
+    if query:
+        # username prefix as a range on the normalized key, an index search where LIKE 'q%' would scan
+        key = normalize_name(query)
+        filters += [User.username_key >= key, User.username_key < key + '\U0010ffff']
+    if role:
+        filters.append(User.admin == (role == 'admin'))
+    return filters
+
+def encode_user_cursor(sort, row):
+    if sort == 'id':
+        return str(row.id)
+    value = int(bool(row.admin)) if sort == 'admin' else row.username_key
+    return f'{value}:{row.id}'
+
+def decode_user_cursor(sort, cursor):
+    try:
+        if sort == 'id':
+            return (int(cursor),)
+        value, _, user_id = cursor.rpartition(':') # usernames may contain ':', the id never does
+        return (bool(int(value)) if sort == 'admin' else value, int(user_id))
+    except (AttributeError, ValueError):
+        return None
+
+def user_select(sort='id', direction='asc', query='', role=''):
+    columns = USER_SORTS[sort]
+    order = columns if direction == 'asc' else [column.desc() for column in columns]
+    return db.select(User.id, User.username, User.username_key, User.admin).where(*user_filters(query, role)).order_by(*order)
+
+class UserPage:
+    def __init__(self, items, next_cursor, options):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.options = options
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+def user_listing(per_page, after=None, **options):
+    # next page links only, the list starts over from the first page when the sort or filter changes
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+    options = dict(listing_options({}), **options)
+    statement = user_select(**options)
+    cursor = decode_user_cursor(options['sort'], after) if after else None
+    if cursor:
+        columns = USER_SORTS[options['sort']]
+        position = db.tuple_(*columns)
+        statement = statement.where(position > cursor if options['direction'] == 'asc' else position < cursor)
+    rows = db.session.execute(statement.limit(per_page + 1)).all()
+    next_cursor = encode_user_cursor(options['sort'], rows[per_page - 1]) if len(rows) > per_page else None
+    return UserPage(rows[:per_page], next_cursor, options)
+
+def users_csv(batch_size=1000, **options):
+    # a generator of CSV chunks, one per batch of rows, for a streamed response
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('id', 'username', 'admin'))
+    yield buffer.getvalue()
+    statement = user_select(**options).execution_options(stream_results=True, yield_per=batch_size)
+    for rows in db.session.execute(statement).partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows((row.id, row.username, int(bool(row.admin))) for row in rows)
+        yield buffer.getvalue()
+
+def bulk_user_action(action, acting_user_id, user_ids=None, query='', role=''):
+    # applies action to user_ids, or to every user matching query and role when user_ids is None.
+    # the acting admin is always left out so nobody locks themselves out. Returns the number of users changed,
+    # the caller commits
+    if action not in BULK_ACTIONS:
+        raise ValueError(f'unknown action {action!r}')
+    targets = [User.id != acting_user_id]
+    if user_ids is not None:
+        if not user_ids:
+            return 0
+        targets.append(User.id.in_(user_ids))
+    else:
+        targets += user_filters(query, role)
+
+    # nothing is loaded in the session, so there is nothing for the ORM to synchronize
+    options = {'synchronize_session': False}
+    if action == 'delete':
+        target_ids = db.select(User.id).where(*targets)
+        cart_ids = db.select(Cart.id).where(Cart.user_id.in_(target_ids))
+        db.session.execute(db.delete(CartItem).where(CartItem.cart_id.in_(cart_ids)), execution_options=options)
+        db.session.execute(db.delete(Cart).where(Cart.user_id.in_(target_ids)), execution_options=options)
+        result = db.session.execute(db.delete(User).where(*targets), execution_options=options)
+    else:
+        result = db.session.execute(db.update(User).where(*targets).values(admin=action == 'promote'), execution_options=options)
+    forget_users(db.session, user_ids) # these statements skip the session events that drop cached users
+    return result.rowcount
@@ -0,0 +1,253 @@
+from functools import wraps
+from flask import Blueprint, request, jsonify
+from flask_login import current_user
+from app import db
+from app.catalog import LISTING_ORDER, cursor_for, cursor_segments, decode_cursor, listing_order, product_details
+from app.images import is_stored_name
+from app.models import Product, Category, Cart, cents_to_decimal, normalize_name
+from sqlalchemy.exc import IntegrityError
+
+# JSON API, version 1
+# responses are built straight from column tuples, no ORM objects or products_show dicts in between.
+# lists take ?fields=id,name,price to return only what the client shows, and bulk writes take a list and
+# run in one transaction, so a client syncing a cart or importing products needs one round trip.
+#
+#   GET    /api/v1/products?fields=&category=&limit=&after=     keyset paginated like /products
+#   GET    /api/v1/products/<id>
+#   POST   /api/v1/products      (admin) one product or a list of them
+#   POST   /api/v1/categories    (admin) one category or a list of them
+#   GET    /api/v1/cart
+#   PATCH  /api/v1/cart          {"items": [{"product_id": 1, "quantity": 3}, ...]}, 0 removes the line
+#   POST   /api/v1/cart/items    {"product_id": 1, "quantity": 1}, adds to the line
+#   DELETE /api/v1/cart/items/<product_id>
+
+API_PREFIX = '/api/v1'
+MAX_PAGE_SIZE = 100
+MAX_BULK_ITEMS = 500 # keeps a bulk upsert well under SQLite's bound parameter limit
+
+api_v1 = Blueprint('api', __name__, url_prefix=API_PREFIX) # registered by create_app
+
+# field name -> column, 'category' needs the join
+PRODUCT_FIELDS = {
+    'id': Product.id,
+    'name': Product.name,
+    'price': Product.price_cents,
+    'description': Product.description,
+    'image_path': Product.image_path,
+    'category_id': Product.category_id,
+    'category': Category.name
+}
+DEFAULT_PRODUCT_FIELDS = ('id', 'name', 'price', 'category')
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+@api_v1.errorhandler(APIError)
+def api_error(error):
+    return jsonify({'error': error.message}), error.status
+
+def api_login_required(func):
+    # like login_required, but a 401 instead of a redirect to the login page
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise APIError('login required', 401)
+        return func(*args, **kwargs)
+    return decorated_view
+
+def api_admin_required(func):
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise APIError('login required', 401)
+        if not current_user.is_admin():
+            raise APIError('admin only', 403)
+        return func(*args, **kwargs)
+    return decorated_view
+
+def json_body():
+    data = request.get_json(silent=True)
+    if data is None:
+        raise APIError('expected a JSON body')
+    return data
+
+def as_list(data):
+    items = data if isinstance(data, list) else [data]
+    if not items or len(items) > MAX_BULK_ITEMS:
+        raise APIError(f'send between 1 and {MAX_BULK_ITEMS} items')
+    return items
+
+def selected_fields():
+    fields = request.args.get('fields')
+    if not fields:
+        return DEFAULT_PRODUCT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise APIError(f'unknown field(s): {", ".join(unknown)}, choose from {", ".join(PRODUCT_FIELDS)}')
+    return fields
+
+def serialize(field, value):
+    return str(cents_to_decimal(value)) if field == 'price' and value is not None else value
+
+
+@api_v1.route('/products')
+def api_products():
+    fields = selected_fields()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PAGE_SIZE)
+    # the listing order columns are always selected, they make the cursor for the next page
+    query = db.session.query(*LISTING_ORDER, *[PRODUCT_FIELDS[field] for field in fields])
+    if 'category' in fields:
+        query = query.outerjoin(Category, Product.category_id == Category.id)
+    category_id = request.args.get('category', type=int)
+    if category_id:
+        query = query.filter(Product.category_id == category_id)
+    after = request.args.get('after')
+    if after:
+        cursor = decode_cursor(after)
+        if cursor is None:
+            raise APIError('bad cursor')
+        rows = []
+        for condition in cursor_segments(cursor):
+            rows += query.filter(condition).order_by(*listing_order()).limit(limit + 1 - len(rows)).all()
+            if len(rows) > limit:
+                break
+    else:
+        rows = query.order_by(*listing_order()).limit(limit + 1).all()
+
+    offset = len(LISTING_ORDER)
+    products = [{field: serialize(field, row[offset + i]) for i, field in enumerate(fields)} for row in rows[:limit]]
+    next_cursor = cursor_for(*rows[limit - 1][:offset]) if len(rows) > limit else None
+    return jsonify({'products': products, 'next': next_cursor})
+
+@api_v1.route('/products/<int:id>')
+def api_product(id):
+    product = product_details(id) # the same cached dict the product page uses
+    if product is None:
+        raise APIError('product not found', 404)
+    return jsonify(dict(product, id=id))
+
+@api_v1.route('/products', methods=['POST'])
+@api_admin_required
+def api_create_products():
+    items = as_list(json_body())
+    category_ids = {item['category_id'] for item in items if isinstance(item, dict) and isinstance(item.get('category_id'), int)}
+    categories = {category.id: category for category in Category.query.filter(Category.id.in_(category_ids))}
+    products = []
+    for index, item in enumerate(items):
+        try:
+            category = categories[item['category_id']]
+            product = Product(item['name'], item['price'], category, item.get('image_path', ''),
+                              item.get('description') or 'No description available')
+        except (KeyError, TypeError, ValueError, ArithmeticError):
+            raise APIError(f'item {index}: needs name, price and an existing category_id')
+        if not isinstance(item['name'], str) or not item['name'].strip() or product.price_cents <= 0:
+            raise APIError(f'item {index}: name must not be empty and price must be at least 0.01')
+        if product.image_path and not is_stored_name(product.image_path):
+            raise APIError(f'item {index}: image_path must be the name of a stored image')
+        products.append(product)
+    db.session.add_all(products)
+    db.session.commit() # all or nothing
+    return jsonify({'products': [{'id': product.id, 'name': product.name} for product in products]}), 201
+
+@api_v1.route('/categories', methods=['POST'])
+@api_admin_required
+def api_create_categories():
+    items = as_list(json_body())
+    names = [item.get('name') if isinstance(item, dict) else item for item in items] # {"name": ...} or a bare string
+    if not all(isinstance(name, str) and name.strip() for name in names):
+        raise APIError('every category needs a name')
+    if len({normalize_name(name) for name in names}) != len(names):
+        raise APIError('duplicate names in the request')
+    categories = [Category(name.strip()) for name in names]
+    db.session.add_all(categories)
+    try:
+        db.session.commit()
+    except IntegrityError: # the unique name_key index, one of the names exists already
+        db.session.rollback()
+        raise APIError('a category with one of these names exists already', 409)
+    return jsonify({'categories': [{'id': category.id, 'name': category.name} for category in categories]}), 201
+
+
+def cart_response(cart):
+    items, total = cart.summary() if cart else ([], cents_to_decimal(0))
+    return jsonify({
+        'items': [{
+            'product_id': item['product'].id,
+            'name': item['product'].name,
+            'price': str(item['product'].price),
+            'quantity': item['quantity'],
+            'subtotal': str(item['subtotal'])
+        } for item in items],
+        'total': str(total)
+    })
+
+def check_products(product_ids):
+    # one IN (...) query for every product id in the request
+    found = {row[0] for row in db.session.query(Product.id).filter(Product.id.in_(product_ids))}
+    missing = sorted(set(product_ids) - found)
+    if missing:
+        raise APIError(f'unknown product(s): {", ".join(map(str, missing))}', 404)
+
+def quantity_of(item, default=None):
+    quantity = item.get('quantity', default)
+    if isinstance(quantity, bool) or not isinstance(quantity, int):
+        raise APIError('quantity must be a whole number')
+    return quantity
+
+@api_v1.route('/cart')
+@api_login_required
+def api_cart():
+    return cart_response(Cart.query.filter_by(user_id=current_user.id).first())
+
+@api_v1.route('/cart', methods=['PATCH'])
+@api_login_required
+def api_update_cart():
+    data = json_body()
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise APIError('expected {"items": [{"product_id": ..., "quantity": ...}, ...]}')
+    items = as_list(items)
+    quantities = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('product_id'), int):
+            raise APIError('every item needs a product_id and a quantity')
+        quantities[item['product_id']] = quantity_of(item)
+    check_products(quantities)
+    cart = Cart.for_user(current_user.id)
+    cart.set_quantities(quantities)
+    db.session.commit() # every line changes together or none does
+    return cart_response(cart)
+
+@api_v1.route('/cart/items', methods=['POST'])
+@api_login_required
+def api_add_cart_item():
+    item = json_body()
+    if not isinstance(item, dict) or not isinstance(item.get('product_id'), int):
+        raise APIError('needs a product_id')
+    quantity = quantity_of(item, default=1)
+    if quantity < 1:
+        raise APIError('quantity must be at least 1')
+    check_products([item['product_id']])
+    cart = Cart.for_user(current_user.id)
+    cart.add_item(item['product_id'], quantity=quantity)
+    db.session.commit()
+    return cart_response(cart), 201
+
+@api_v1.route('/cart/items/<int:product_id>', methods=['DELETE'])
+@api_login_required
+def api_remove_cart_item(product_id):
+    try:
+        quantity = int(request.args.get('quantity', 1)) # not type=int, that quietly falls back to 1 on '2.5' or 'two'
+    except ValueError:
+        raise APIError('quantity must be a whole number')
+    if quantity < 1:
+        raise APIError('quantity must be at least 1')
+    cart = Cart.query.filter_by(user_id=current_user.id).first()
+    if cart is None or not cart.remove_item(product_id, quantity=quantity):
+        raise APIError('product is not in the cart', 404)
+    db.session.commit()
+    return cart_response(cart)
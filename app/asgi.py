@@ -0,0 +1,167 @@
+import io
+import sys
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, render_template, request, make_response, request_started
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from app import login_manager
+from app import asyncdb
+from app.cache import catalog_cache
+from app.maintenance import maintenance_scheduler
+from app.pagecache import page_cache_ttl, page_cache_key, page_entry, conditional_page
+
+# ASGI serving mode: uvicorn asgi:asgi_app (pip install uvicorn asgiref aiosqlite), asgi.py wraps create_app() with make_asgi_app
+# GET and HEAD on the read heavy pages (homepage, product listing, product page, cart) are answered here with async
+# views that read through app/asyncdb.py, so a worker keeps serving other connections while one waits on the database.
+# They run inside a normal Flask request context, so sessions, flask-login, before/teardown hooks, error handlers
+# and templates work as in the WSGI views in app/routes.py, which they mirror. Every other request goes to the
+# unchanged Flask app through asgiref's WSGI adapter, which runs it on a thread pool.
+# The WSGI mode (flask run, gunicorn main:app) doesn't import any of this
+
+def wsgi_environ(scope):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(), # only bodiless GET and HEAD requests end up here
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    host, port = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = host, str(port or 0)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        key = name if name in ('CONTENT_LENGTH', 'CONTENT_TYPE') else 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value # repeated headers, like a WSGI server joins them
+        environ[key] = value
+    return environ
+
+
+def async_cached_page(view):
+    # app.pagecache.cached_page for async views
+    async def decorated_view(**kwargs):
+        key = page_cache_key()
+        if key is None:
+            return await view(**kwargs)
+        entry = catalog_cache.get(key)
+        if entry is not None:
+            return conditional_page(entry)
+        response = make_response(await view(**kwargs))
+        entry = page_entry(response)
+        if entry is None:
+            return response
+        catalog_cache.set(key, entry, ttl=page_cache_ttl())
+        return conditional_page(entry, response)
+    return decorated_view
+
+def async_login_required(view):
+    async def decorated_view(**kwargs):
+        # the user comes from the identity cache, only a cache miss reads the users table (synchronously)
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        return await view(**kwargs)
+    return decorated_view
+
+@async_login_required
+async def homepage():
+    products_show = await asyncdb.random_products(9)
+    return render_template('homepage.html', page_name='Homepage', products_show=products_show)
+
+@async_cached_page
+async def products(page=1):
+    per_page = 3
+    pagination = await asyncdb.product_listing(per_page, page=page, after=request.args.get('after'), before=request.args.get('before'))
+    products_show = {row.id: asyncdb.card(row) for row in pagination.items}
+    return render_template('product view.html', page_name='Products', products_show=products_show, per_page=per_page, pagination=pagination)
+
+@async_cached_page
+async def product(id):
+    product = await asyncdb.product_details(id)
+    if product is None:
+        abort(404)
+    return render_template('product page.html', page_name=f'{product["name"]}', products_show={id: product})
+
+@async_login_required
+async def view_cart():
+    cart_items, total = await asyncdb.cart_summary(current_user.id)
+    return render_template('cart view.html', cart_items=cart_items, total=total)
+
+# endpoint -> async view, the endpoints and URL rules are the ones registered in app/routes.py
+ASYNC_VIEWS = {
+    'catalog.homepage': homepage,
+    'catalog.products': products,
+    'catalog.product': product,
+    'cart.view_cart': view_cart
+}
+
+
+async def dispatch(app, environ, view, args):
+    # Flask.wsgi_app and Flask.full_dispatch_request with an awaited view
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        ctx.push()
+        try:
+            request_started.send(app, _async_wrapper=app.ensure_sync)
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await view(**args)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        response = app.finalize_request(rv)
+    except Exception as e:
+        error = e
+        response = app.handle_exception(e)
+    try:
+        return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+    finally:
+        ctx.pop(error)
+
+async def lifespan(app, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if app.config.get('MAINTENANCE_INTERVAL'): # async views skip before_request, start it with the worker
+                maintenance_scheduler.start(app)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if asyncdb.engine is not None:
+                await asyncdb.engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+def make_asgi_app(app):
+    wsgi_fallback = WsgiToAsgi(app)
+
+    async def asgi_app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await lifespan(app, receive, send)
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await wsgi_fallback(scope, receive, send)
+
+        environ = wsgi_environ(scope)
+        try:
+            endpoint, args = app.url_map.bind_to_environ(environ).match()
+        except HTTPException: # redirects, 404s and 405s are Flask's business
+            endpoint = None
+        view = ASYNC_VIEWS.get(endpoint)
+        if view is None:
+            return await wsgi_fallback(scope, receive, send)
+
+        status, headers, body = await dispatch(app, environ, view, args)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+    return asgi_app
@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError: # optional, without it only gzip copies are made
+    brotli = None
+
+# fingerprinted static files
+# every url_for('static', filename=...) gets ?v=<hash of the file> added, so templates keep using plain url_for.
+# A request carrying the current hash can be cached forever (Cache-Control: immutable), the URL changes with
+# the file. Hashes are worked out on first use and kept per worker, product images are already named after
+# their sha256 so theirs come from the name without reading the file.
+# `flask compress-static` writes .gz (and .br with the brotli package) copies of text assets once per deploy,
+# they are served instead of the original to clients that accept them.
+
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+CONTENT_HASH_NAME = re.compile(r'^([0-9a-f]{64})(-\d+)?\.\w+$') # store_upload names and their variants
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz')) # preferred first
+
+class StaticFingerprints:
+    def __init__(self):
+        self.hashes = {} # filename -> (mtime, size, fingerprint)
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        match = CONTENT_HASH_NAME.match(os.path.basename(filename))
+        if match:
+            return match.group(1)[:FINGERPRINT_LENGTH] + (match.group(2) or '')
+        path = safe_join(current_app.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError): # missing file or a path outside the static folder
+            return None
+        cached = self.hashes.get(filename)
+        if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(65536), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()[:FINGERPRINT_LENGTH]
+        with self.lock:
+            self.hashes[filename] = (stat.st_mtime, stat.st_size, fingerprint)
+        return fingerprint
+
+static_fingerprints = StaticFingerprints()
+
+def add_static_fingerprint(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprints.get(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+def send_static_file(filename):
+    fingerprinted = request.args.get('v') is not None and request.args.get('v') == static_fingerprints.get(filename)
+    # an outdated or missing ?v= still gets the file, just with the default short cache lifetime
+    max_age = IMMUTABLE_MAX_AGE if fingerprinted else None
+    accepted = request.accept_encodings
+    response = None
+    for encoding, suffix in ENCODINGS:
+        compressed = safe_join(current_app.static_folder, filename + suffix)
+        if accepted[encoding] and compressed and os.path.isfile(compressed):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(current_app.static_folder, filename + suffix, mimetype=mimetype, max_age=max_age)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(current_app.static_folder, filename, max_age=max_age)
+    response.vary.add('Accept-Encoding')
+    if fingerprinted:
+        response.cache_control.immutable = True # no revalidation on reload either
+    return response
+
+@click.command('compress-static')
+@with_appcontext
+def compress_static():
+    """Write .gz and .br copies of the text files in the static folder."""
+    written = 0
+    for root, dirs, files in os.walk(current_app.static_folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as file:
+                data = file.read()
+            copies = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                copies.append(('.br', lambda: brotli.compress(data, quality=11)))
+            for suffix, compress in copies:
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue # up to date
+                with open(target, 'wb') as file:
+                    file.write(compress())
+                written += 1
+    click.echo(f'{written} compressed file(s) written')
+
+def init_assets(app):
+    app.url_defaults(add_static_fingerprint)
+    app.view_functions['static'] = send_static_file
+    app.cli.add_command(compress_static)
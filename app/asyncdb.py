@@ -0,0 +1,148 @@
+import random
+import threading
+from flask import current_app
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import db
+from app.cache import catalog_cache
+from app.catalog import ProductPage, cursor_segments, decode_cursor, listing_order, product_pool
+from app.database import engine_options, configure_sqlite
+from app.metrics import instrument_engine
+from app.models import Product, Category, Cart, CartItem, cents_to_decimal
+
+# async versions of the reads behind the read heavy pages, used by the ASGI mode (app/asgi.py).
+# they run the same SQL as the sync code in app/catalog.py and app/models.py through an async engine
+# (aiosqlite for SQLite, asyncpg for PostgreSQL) and share its caches, so both modes see the same data.
+# results are plain dicts and rows, nothing here is attached to the Flask-SQLAlchemy session
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+engine = None
+engine_lock = threading.Lock()
+
+def async_engine():
+    # one per worker process, made on first use so the WSGI mode never imports aiosqlite
+    global engine
+    if engine is None:
+        with engine_lock:
+            if engine is None:
+                uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+                url = make_url(uri)
+                url = url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+                new_engine = create_async_engine(url, **engine_options(uri))
+                configure_sqlite(new_engine.sync_engine, current_app.config['SQLITE_PRAGMAS'])
+                instrument_engine(new_engine.sync_engine)
+                engine = new_engine
+    return engine
+
+async def fetch_all(statement):
+    async with async_engine().connect() as connection:
+        return (await connection.execute(statement)).all()
+
+async def fetch_scalar(statement):
+    async with async_engine().connect() as connection:
+        return (await connection.execute(statement)).scalar()
+
+
+# listing rows carry the listing order columns, so ProductPage can build its cursors from them like from a Product
+def listing_select():
+    return db.select(Product.id, Product.name, Product.price_cents, Product.image_path, Product.category_id,
+                     Category.name.label('category_name')).outerjoin(Category, Product.category_id == Category.id)
+
+def card(row):
+    # the products_show shape the grids render
+    return {
+        'name': row.name,
+        'price': str(cents_to_decimal(row.price_cents)),
+        'category': row.category_name,
+        'image_path': row.image_path
+    }
+
+async def random_products(amount):
+    if current_app.config.get('PRODUCT_SAMPLING', 'pool') == 'sql':
+        rows = await fetch_all(listing_select().order_by(db.func.random()).limit(amount))
+        return {row.id: card(row) for row in rows}
+    # same id pool as the sync homepage, loaded or topped up without blocking the event loop
+    if product_pool.loaded:
+        for product_id in [row[0] for row in await fetch_all(db.select(Product.id).where(Product.id > product_pool.max_id))]:
+            product_pool.add(product_id)
+    else:
+        product_pool.reset([row[0] for row in await fetch_all(db.select(Product.id).order_by(Product.id))])
+
+    rows = []
+    for attempt in range(2): # retry once for ids deleted by another worker, like ProductIdPool.sample
+        picked = product_pool.pick(amount, {row.id for row in rows})
+        if not picked:
+            break
+        found = await fetch_all(listing_select().where(Product.id.in_(picked)))
+        found_ids = {row.id for row in found}
+        for product_id in picked:
+            if product_id not in found_ids:
+                product_pool.discard(product_id)
+        rows.extend(found)
+        if len(rows) >= amount:
+            break
+    random.shuffle(rows)
+    return {row.id: card(row) for row in rows}
+
+async def product_count():
+    ttl = current_app.config.get('PRODUCT_COUNT_TTL', 60)
+    count = catalog_cache.get('product_count') if ttl else None
+    if count is None:
+        count = await fetch_scalar(db.select(db.func.count(Product.id)))
+        if ttl:
+            catalog_cache.set('product_count', count, ttl=ttl)
+    return count
+
+async def product_listing(per_page, page=1, after=None, before=None):
+    # app.catalog.product_listing, see there for the keyset details
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+    if before:
+        rows = []
+        for condition in cursor_segments(before, descending=True):
+            rows += await fetch_all(listing_select().where(condition).order_by(*listing_order(descending=True)).limit(per_page + 1 - len(rows)))
+            if len(rows) > per_page:
+                break
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = len(rows) > per_page, True
+    elif after:
+        rows = []
+        for condition in cursor_segments(after):
+            rows += await fetch_all(listing_select().where(condition).order_by(*listing_order()).limit(per_page + 1 - len(rows)))
+            if len(rows) > per_page:
+                break
+        items = rows[:per_page]
+        has_prev, has_next = True, len(rows) > per_page
+    else:
+        offset = (page - 1) * per_page
+        rows = await fetch_all(listing_select().order_by(*listing_order()).offset(offset).limit(per_page + 1))
+        items = rows[:per_page]
+        has_prev, has_next = page > 1, len(rows) > per_page
+    return ProductPage(items, page, per_page, await product_count(), has_prev, has_next)
+
+async def product_details(product_id):
+    key = f'product:{product_id}' # same entry as app.catalog.product_details
+    details = catalog_cache.get(key)
+    if details is None:
+        rows = await fetch_all(listing_select().add_columns(Product.description).where(Product.id == product_id))
+        if not rows:
+            return None
+        details = dict(card(rows[0]), description=rows[0].description)
+        catalog_cache.set(key, details)
+    return details
+
+async def cart_summary(user_id):
+    # Cart.summary for the user's cart, an empty cart when they don't have one yet
+    subtotal = Product.price_cents * CartItem.quantity
+    rows = await fetch_all(
+        db.select(Product.id, Product.name, CartItem.quantity, subtotal.label('subtotal'), db.func.sum(subtotal).over().label('total'))
+        .join(CartItem, CartItem.product_id == Product.id).join(Cart, Cart.id == CartItem.cart_id)
+        .where(Cart.user_id == user_id).order_by(CartItem.id)
+    )
+    items = [{
+        'product': {'id': row.id, 'name': row.name},
+        'quantity': row.quantity,
+        'subtotal': cents_to_decimal(row.subtotal)
+    } for row in rows]
+    return items, cents_to_decimal(rows[0].total if rows else 0)
@@ -0,0 +1,159 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from importlib import import_module
+from flask import current_app
+
+# small cache layer for catalog data (product details, category lists, counts)
+# the default backend is an in-process LRU with a TTL. Every worker has its own copy, so writes made in
+# another worker are only picked up once the TTL runs out. Point CATALOG_CACHE_BACKEND at a shared backend
+# ('package.module:ClassName', built with the app config) if that matters.
+# a backend only needs get(key) -> value or None, set(key, value, ttl=None), delete(key) and clear()
+# every CatalogCache has a namespace that prefixes its keys. On a shared backend the prefix also carries a
+# generation token stored in the backend, clear() starts a new generation instead of flushing the backend, so
+# clearing the user cache doesn't drop catalog entries or the other way round. The old entries run out by their TTL
+
+class LRUCache:
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl # default lifetime in seconds, 0 or None keeps entries until they are evicted
+        self.items = OrderedDict() # key -> (expiry time, value), oldest entries first
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.items[key] # expired, treat it as a miss
+                return None
+            self.items.move_to_end(key) # mark as recently used
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.items[key] = (expires, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False) # drop the least recently used entry
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+def load_backend(config):
+    backend = config.get('CATALOG_CACHE_BACKEND')
+    if not backend:
+        return LRUCache(config.get('CATALOG_CACHE_SIZE', 1024), config.get('CATALOG_CACHE_TTL', 300))
+    if isinstance(backend, str):
+        module_name, _, class_name = backend.partition(':')
+        backend = getattr(import_module(module_name), class_name)
+    return backend(config) if isinstance(backend, type) else backend # a class is built with the config, an instance is used as is
+
+class CatalogCache:
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.backend = None # created from the app config on first use
+        self.shared = False # whether the backend may hold other caches' keys, CATALOG_CACHE_BACKEND is set
+        self.hits = 0
+        self.misses = 0
+        self.version = 0 # bumped on every invalidation, handy as part of a cache key for derived data
+        self.lock = threading.Lock()
+
+    def get_backend(self):
+        if self.backend is None:
+            with self.lock:
+                if self.backend is None:
+                    self.shared = bool(current_app.config.get('CATALOG_CACHE_BACKEND'))
+                    self.backend = load_backend(current_app.config)
+        return self.backend
+
+    def prefix(self):
+        backend = self.get_backend()
+        if not self.shared: # an in-process LRU of its own, nothing else to keep apart
+            return f'{self.namespace}:'
+        generation_key = f'{self.namespace}:generation'
+        generation = backend.get(generation_key)
+        if generation is None: # first use, or the token expired: a new generation, which only costs misses
+            generation = uuid.uuid4().hex[:8]
+            backend.set(generation_key, generation)
+        return f'{self.namespace}:{generation}:'
+
+    def get(self, key):
+        value = self.get_backend().get(self.prefix() + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if value is not None: # None means "not cached", so it is never stored
+            self.get_backend().set(self.prefix() + key, value, ttl=ttl)
+
+    def get_or_load(self, key, loader, ttl=None):
+        # read-through: return the cached value, or call loader() and cache what it returns (None is never cached)
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value, ttl=ttl)
+        return value
+
+    def delete(self, *keys):
+        # drop entries without touching the catalog version, for data cached here that pages don't show
+        backend = self.get_backend()
+        prefix = self.prefix()
+        for key in keys:
+            backend.delete(prefix + key)
+
+    def invalidate(self, *keys):
+        self.delete(*keys, 'catalog_version')
+        self.version += 1
+
+    def page_version(self):
+        # a token that changes whenever the catalog does, for keys of cached pages and fragments.
+        # it lives in the backend rather than on this object so workers sharing a backend agree on it
+        backend = self.get_backend()
+        key = self.prefix() + 'catalog_version'
+        token = backend.get(key)
+        if token is None:
+            token = uuid.uuid4().hex[:12]
+            backend.set(key, token)
+        return token
+
+    def clear(self):
+        backend = self.get_backend()
+        if self.shared:
+            backend.set(f'{self.namespace}:generation', uuid.uuid4().hex[:8]) # only this namespace, see above
+        else:
+            backend.clear()
+        self.version += 1
+
+    def stats(self):
+        backend = self.get_backend()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': getattr(backend, 'evictions', None), # None when the backend doesn't report them
+            'size': len(backend) if hasattr(backend, '__len__') else None,
+            'max_size': getattr(backend, 'max_size', None),
+            'version': self.version
+        }
+
+catalog_cache = CatalogCache('catalog')
@@ -0,0 +1,332 @@
+import random
+import threading
+from collections import Counter
+from flask import current_app
+from sqlalchemy import event
+from app import db
+from app.cache import catalog_cache
+from app.models import Product, Category
+
+# every product card shows the category name, so listings load the category in the same query
+# instead of one lazy SELECT per product
+def products_with_category():
+    return Product.query.options(db.joinedload(Product.category))
+
+# random product sampling through the primary key index
+# ORDER BY random() makes SQLite read and sort every product row, so instead we keep a pool of product ids
+# in memory, pick ids from it in python and fetch only those rows with an id IN (...) lookup
+class ProductIdPool:
+    def __init__(self):
+        self.ids = [] # every known product id
+        self.positions = {} # product id -> index inside self.ids, makes removal O(1)
+        self.max_id = 0 # highest id seen so far, used for incremental refreshes
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        # one full read of the id column, only done on the first sample of each worker
+        self.reset([row[0] for row in db.session.query(Product.id).order_by(Product.id)])
+
+    def reset(self, ids):
+        with self.lock:
+            self.ids = []
+            self.positions = {}
+            self.max_id = 0
+            for product_id in ids:
+                self._add(product_id)
+            self.loaded = True
+
+    def refresh(self):
+        # pick up products committed by other workers, this is a range search on the primary key.
+        # ids are never reused (Product is AUTOINCREMENT), so every new product has an id above max_id
+        new_ids = db.session.query(Product.id).filter(Product.id > self.max_id).order_by(Product.id)
+        for row in new_ids:
+            self.add(row[0])
+
+    def add(self, product_id):
+        with self.lock:
+            self._add(product_id)
+
+    def discard(self, product_id):
+        with self.lock:
+            index = self.positions.pop(product_id, None)
+            if index is None:
+                return
+            last_id = self.ids.pop() # swap the last id into the free slot so nothing has to shift
+            if last_id != product_id:
+                self.ids[index] = last_id
+                self.positions[last_id] = index
+
+    def _add(self, product_id):
+        if product_id in self.positions:
+            return
+        self.positions[product_id] = len(self.ids)
+        self.ids.append(product_id)
+        self.max_id = max(self.max_id, product_id)
+
+    def pick(self, amount, taken=()):
+        # up to amount - len(taken) random ids that aren't in taken
+        with self.lock:
+            picked = random.sample(self.ids, min(amount, len(self.ids)))
+        return [i for i in picked if i not in taken][:amount - len(taken)]
+
+    def sample(self, amount):
+        if self.loaded:
+            self.refresh()
+        else:
+            self.load()
+
+        products = []
+        # retry once in case some picked ids were deleted by another worker since we saw them
+        for attempt in range(2):
+            picked = self.pick(amount, {product.id for product in products})
+            if not picked:
+                break
+            found = products_with_category().filter(Product.id.in_(picked)).all()
+            found_ids = {product.id for product in found}
+            for product_id in picked:
+                if product_id not in found_ids:
+                    self.discard(product_id) # stale id, forget about it
+            products.extend(found)
+            if len(products) >= amount:
+                break
+
+        random.shuffle(products) # IN (...) gives rows back in id order
+        return products
+
+product_pool = ProductIdPool()
+
+def random_products(amount):
+    if current_app.config.get('PRODUCT_SAMPLING', 'pool') == 'sql':
+        return products_with_category().order_by(db.func.random()).limit(amount).all() # old behaviour, full table sort
+    return product_pool.sample(amount)
+
+
+# keyset (seek) pagination for the /products listing
+# the listing is ordered by (category_id, price_cents, id) which is exactly the ix_product_listing index,
+# so every page is an index search starting right after the last row of the previous page instead of an OFFSET
+# products without a category come first (SQLite's default for NULL, spelled out for other databases). NULL never
+# compares, so a cursor on one of them can't go through the plain tuple comparison
+LISTING_ORDER = (Product.category_id, Product.price_cents, Product.id)
+
+def listing_order(descending=False):
+    category, price, product_id = LISTING_ORDER
+    if descending:
+        return [category.desc().nulls_last(), price.desc(), product_id.desc()]
+    return [category.asc().nulls_first(), price.asc(), product_id.asc()]
+
+def cursor_segments(cursor, descending=False):
+    # the conditions for the rows after cursor (before it when descending), in the order the rows come.
+    # each one is an index search on its own, an OR of them would walk the index from one end. A page runs the next
+    # one only when the ones before it came up short, which only happens next to the products without a category
+    category_id, price_cents, product_id = cursor
+    rest = db.tuple_(Product.price_cents, Product.id)
+    if category_id is None:
+        if descending:
+            return [Product.category_id.is_(None) & (rest < (price_cents, product_id))]
+        return [Product.category_id.is_(None) & (rest > (price_cents, product_id)), Product.category_id.is_not(None)]
+    if descending:
+        return [db.tuple_(*LISTING_ORDER) < cursor, Product.category_id.is_(None)]
+    return [db.tuple_(*LISTING_ORDER) > cursor]
+
+def encode_cursor(product):
+    return cursor_for(product.category_id, product.price_cents, product.id)
+
+def cursor_for(category_id, price_cents, product_id):
+    return f'{"" if category_id is None else category_id}:{price_cents}:{product_id}'
+
+def decode_cursor(cursor):
+    try:
+        category_id, price_cents, product_id = cursor.split(':')
+        return (int(category_id) if category_id else None, int(price_cents), int(product_id))
+    except (AttributeError, ValueError):
+        return None
+
+class ProductPage:
+    def __init__(self, items, page, per_page, total, has_prev, has_next):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def pages(self):
+        if not self.total:
+            return 1
+        return -(-self.total // self.per_page) # ceiling division
+
+    @property
+    def prev_num(self):
+        return self.page - 1
+
+    @property
+    def next_num(self):
+        return self.page + 1
+
+    @property
+    def prev_cursor(self):
+        return encode_cursor(self.items[0]) if self.items else None
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.items[-1]) if self.items else None
+
+def product_listing(per_page, page=1, after=None, before=None):
+    query = products_with_category()
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+
+    if before:
+        # walk the index backwards from the cursor and flip the rows back into listing order
+        rows = []
+        for condition in cursor_segments(before, descending=True):
+            rows += query.filter(condition).order_by(*listing_order(descending=True)).limit(per_page + 1 - len(rows)).all()
+            if len(rows) > per_page:
+                break
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = len(rows) > per_page, True
+    elif after:
+        rows = []
+        for condition in cursor_segments(after):
+            rows += query.filter(condition).order_by(*listing_order()).limit(per_page + 1 - len(rows)).all()
+            if len(rows) > per_page:
+                break
+        items = rows[:per_page]
+        has_prev, has_next = True, len(rows) > per_page
+    else:
+        # no cursor: page 1, or an old /products/<page> link which we still answer with an OFFSET
+        offset = (page - 1) * per_page
+        rows = query.order_by(*listing_order()).offset(offset).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = page > 1, len(rows) > per_page
+
+    return ProductPage(items, page, per_page, product_count(), has_prev, has_next)
+
+
+# total number of products for the "page x of y" footer
+# COUNT(*) has to visit every row, so the result is cached for PRODUCT_COUNT_TTL seconds (0 disables caching)
+# and dropped whenever a product is created or deleted
+def product_count():
+    ttl = current_app.config.get('PRODUCT_COUNT_TTL', 60)
+    load = lambda: db.session.query(db.func.count(Product.id)).scalar()
+    if not ttl:
+        return load()
+    return catalog_cache.get_or_load('product_count', load, ttl=ttl)
+
+
+# cached catalog reads, plain dicts and tuples only so nothing is tied to a database session
+def product_details(product_id):
+    def load():
+        product = products_with_category().filter(Product.id == product_id).first()
+        if product is None:
+            return None
+        return {
+            'name': product.name,
+            'price': str(product.price),
+            'category': product.category.name, # category name
+            'description': product.description,
+            'image_path': product.image_path
+        }
+    return catalog_cache.get_or_load(f'product:{product_id}', load)
+
+def category_choices():
+    return catalog_cache.get_or_load('categories', lambda: [(c.id, c.name) for c in Category.query.order_by(Category.id)])
+
+
+# category product counters
+# Category.product_count follows the product rows inside the same transaction: every flush that adds, deletes
+# or moves products adds the difference to the categories involved with UPDATE ... SET product_count = product_count + n,
+# so concurrent writers add up instead of overwriting each other. Core inserts that skip the session
+# (flask catalog import) call add_product_counts themselves, flask catalog recount repairs any drift
+def add_product_counts(connection, deltas):
+    for category_id, delta in deltas.items():
+        if category_id is not None and delta:
+            connection.execute(db.update(Category).where(Category.id == category_id)
+                               .values(product_count=Category.product_count + delta))
+
+def count_product_changes(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Product):
+            deltas[obj.category_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            deltas[obj.category_id] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            # the flush has synced category_id from the relationship by now, so this covers product.category = ... too.
+            # deleted holds the old category because Product.category_id has active_history, without it a product
+            # expired by an earlier commit would only report the new one
+            history = db.inspect(obj).attrs.category_id.history
+            for category_id in history.deleted:
+                deltas[category_id] -= 1
+            for category_id in history.added:
+                deltas[category_id] += 1
+    if not any(deltas.values()):
+        return
+    add_product_counts(session.connection(), deltas)
+    for category_id in deltas:
+        category = session.identity_map.get(db.inspect(Category).identity_key_from_primary_key((category_id,)))
+        if category is not None:
+            session.expire(category, ['product_count']) # reloaded on next access
+
+def recount_products():
+    # sets every category's product_count to its real number of products, returns (id, name, stored, actual)
+    # for the categories that were off. The caller commits
+    actual = db.select(db.func.count(Product.id)).where(Product.category_id == Category.id).scalar_subquery()
+    drifted = db.session.execute(db.select(Category.id, Category.name, Category.product_count, actual)
+                                 .where(Category.product_count != actual).order_by(Category.id)).all()
+    if drifted:
+        db.session.execute(db.update(Category).where(Category.product_count != actual).values(product_count=actual))
+    return drifted
+
+event.listen(db.session, 'after_flush', count_product_changes)
+
+
+# invalidation: whatever writes products or categories (routes, flask shell, scripts) goes through the session,
+# so changes are collected on flush and applied to the cache and id pool only once the transaction commits
+def collect_catalog_changes(session, flush_context):
+    changes = session.info.setdefault('catalog_changes', {'added': set(), 'changed': set(), 'removed': set(), 'categories': False})
+    for obj in session.new:
+        if isinstance(obj, Product):
+            changes['added'].add(obj.id)
+        elif isinstance(obj, Category):
+            changes['categories'] = True
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj):
+            changes['changed'].add(obj.id)
+        elif isinstance(obj, Category) and session.is_modified(obj):
+            changes['categories'] = 'renamed' # product details embed the category name
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes['removed'].add(obj.id)
+        elif isinstance(obj, Category):
+            changes['categories'] = True
+
+def apply_catalog_changes(session):
+    changes = session.info.pop('catalog_changes', None)
+    if not changes:
+        return
+    if changes['categories'] == 'renamed':
+        catalog_cache.clear()
+    else:
+        keys = [f'product:{product_id}' for product_id in changes['changed'] | changes['removed']]
+        if changes['added'] or changes['removed']:
+            keys.append('product_count')
+        if changes['categories']:
+            keys.append('categories')
+        if keys:
+            catalog_cache.invalidate(*keys)
+    for product_id in changes['added']:
+        product_pool.add(product_id) # make new products available to the homepage picks
+    for product_id in changes['removed']:
+        product_pool.discard(product_id)
+
+def discard_catalog_changes(session):
+    session.info.pop('catalog_changes', None)
+
+event.listen(db.session, 'after_flush', collect_catalog_changes)
+event.listen(db.session, 'after_commit', apply_catalog_changes)
+event.listen(db.session, 'after_rollback', discard_catalog_changes)
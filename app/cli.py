@@ -0,0 +1,219 @@
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from app import db
+from app.cache import catalog_cache
+from app.catalog import add_product_counts, recount_products
+from app.maintenance import run_maintenance, format_report
+from app.images import Image, RESIZABLE_EXTENSIONS, store_file, make_variants, variant_widths
+from app.models import Product, Category, decimal_to_cents, cents_to_decimal, normalize_name
+
+# flask catalog import products.csv | products.jsonl
+# flask catalog export products.jsonl (or - for stdout)
+# flask catalog recount (sets Category.product_count to the real counts again, --dry-run only reports)
+# flask create-db (a new database's tables without running the migrations one by one, marked as up to date)
+# flask maintenance run (purges abandoned carts and orphaned cart items, then ANALYZE and an incremental VACUUM,
+#   see app/maintenance.py. --dry-run only counts, --full-vacuum rewrites the SQLite file)
+#
+# one product per CSV row or JSON line with the fields name, price, category (by name), description and
+# optionally image, a file path relative to the import file, or image_path, a name already in UPLOAD_FOLDER.
+# rows are read lazily and inserted BATCH_SIZE at a time with one executemany INSERT and one commit per batch,
+# so memory stays flat. Bad rows are reported and skipped, --strict stops at the first one. Categories are looked up
+# in a name -> id map loaded once (unknown ones are created), images are copied on a thread pool while the
+# batch is being prepared. The export streams rows off a server side cursor.
+
+catalog_cli = AppGroup('catalog', help='Bulk import and export of products.')
+maintenance_cli = AppGroup('maintenance', help='Cart clean up and database upkeep.')
+
+EXPORT_FIELDS = ('id', 'name', 'price', 'category', 'description', 'image_path')
+
+def read_rows(file, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield line # parsed with the rest of the row so a broken line is skipped like any bad row
+
+def file_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class CategoryMap:
+    # normalized name -> id for every category, loaded once, new names are inserted as they show up
+    def __init__(self, create):
+        self.ids = dict(db.session.query(Category.name_key, Category.id))
+        self.create = create
+        self.created = 0
+
+    def id_for(self, name):
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key not in self.ids:
+            if not self.create:
+                raise ValueError(f'unknown category {name!r}')
+            result = db.session.execute(db.insert(Category).values(name=name.strip(), name_key=key))
+            self.ids[key] = result.inserted_primary_key[0]
+            self.created += 1
+        return self.ids[key]
+
+def import_image(source, folder, widths, quality):
+    name = store_file(source, folder)
+    if Image is not None and name.rsplit('.', 1)[-1] in RESIZABLE_EXTENSIONS:
+        make_variants(os.path.join(folder, name), folder, widths, quality)
+    return name
+
+def import_catalog(file, fmt, base_dir='.', batch_size=5000, image_workers=4, create_categories=True, strict=False):
+    config = current_app.config
+    folder, widths, quality = config['UPLOAD_FOLDER'], variant_widths(config), config.get('IMAGE_QUALITY', 80)
+    categories = CategoryMap(create_categories)
+    imported = skipped = 0
+    with ThreadPoolExecutor(max_workers=image_workers, thread_name_prefix='import-images') as images:
+        for batch in batches(enumerate(read_rows(file, fmt), start=1), batch_size):
+            rows, copies = [], {}
+            for number, record in batch:
+                try:
+                    if isinstance(record, str):
+                        record = json.loads(record)
+                    if not (record.get('category') or '').strip(): # every page shows the category, a product needs one
+                        raise ValueError('needs a category')
+                    row = {
+                        'name': record['name'].strip(),
+                        'price_cents': decimal_to_cents(record['price']),
+                        'description': (record.get('description') or '').strip() or 'No description available',
+                        'image_path': record.get('image_path') or ''
+                    }
+                    if not row['name'] or row['price_cents'] <= 0:
+                        raise ValueError('needs a name and a price of at least 0.01')
+                    if row['image_path'] and os.path.basename(row['image_path']) != row['image_path']:
+                        raise ValueError('image_path must be a file name in UPLOAD_FOLDER, without directories')
+                    # last, once the row is known to be good: a new category is inserted here, and a row skipped
+                    # after that would leave it behind without products
+                    row['category_id'] = categories.id_for(record['category'])
+                except Exception as error:
+                    if strict:
+                        raise click.ClickException(f'row {number}: {error}')
+                    click.echo(f'skipping row {number}: {error}', err=True)
+                    skipped += 1
+                    continue
+                if record.get('image'):
+                    copies[len(rows)] = images.submit(import_image, os.path.join(base_dir, record['image']), folder, widths, quality)
+                rows.append(row)
+            for index, copy in copies.items():
+                try:
+                    rows[index]['image_path'] = copy.result()
+                except OSError as error:
+                    if strict:
+                        raise click.ClickException(f'image for {rows[index]["name"]!r}: {error}')
+                    click.echo(f'no image for {rows[index]["name"]!r}: {error}', err=True)
+            if rows:
+                db.session.execute(db.insert(Product), rows) # executemany, one round of the INSERT per batch
+                add_product_counts(db.session.connection(), Counter(row['category_id'] for row in rows)) # committed with the batch
+            db.session.commit()
+            imported += len(rows)
+    # the core inserts skip the session events that normally invalidate the catalog cache
+    catalog_cache.clear()
+    return imported, skipped, categories.created
+
+def export_catalog(file, fmt, batch_size=5000):
+    query = db.select(Product.id, Product.name, Product.price_cents, Category.name, Product.description, Product.image_path) \
+        .outerjoin(Category, Product.category_id == Category.id).order_by(Product.id)
+    # stream_results keeps a server side cursor on databases that have one, yield_per fetches batch_size rows at a time
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+    writer = csv.writer(file) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    exported = 0
+    for product_id, name, price_cents, category, description, image_path in result:
+        values = (product_id, name, str(cents_to_decimal(price_cents)), category, description, image_path)
+        if writer:
+            writer.writerow(values)
+        else:
+            file.write(json.dumps(dict(zip(EXPORT_FIELDS, values))) + '\n')
+        exported += 1
+    return exported
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per INSERT and commit.')
+@click.option('--image-workers', default=4, show_default=True, help='Threads copying and resizing images.')
+@click.option('--create-categories/--no-create-categories', default=True, show_default=True)
+@click.option('--strict', is_flag=True, help='Stop at the first bad row instead of skipping it.')
+def import_command(path, fmt, batch_size, image_workers, create_categories, strict):
+    """Import products from a CSV or JSONL file."""
+    start = time.perf_counter()
+    with open(path, newline='', encoding='utf-8') as file:
+        imported, skipped, created = import_catalog(file, file_format(path, fmt), os.path.dirname(os.path.abspath(path)),
+                                                    batch_size, image_workers, create_categories, strict)
+    elapsed = time.perf_counter() - start
+    click.echo(f'{imported} product(s) imported, {skipped} skipped, {created} new categories in {elapsed:.1f}s')
+
+@catalog_cli.command('export')
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension, jsonl for stdout.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows fetched at a time.')
+def export_command(path, fmt, batch_size):
+    """Export every product to a CSV or JSONL file, - writes to stdout."""
+    if path == '-':
+        exported = export_catalog(sys.stdout, fmt or 'jsonl', batch_size)
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            exported = export_catalog(file, file_format(path, fmt), batch_size)
+    click.echo(f'{exported} product(s) exported', err=True)
+
+@catalog_cli.command('recount')
+@click.option('--dry-run', is_flag=True, help='Only report the categories whose count is off.')
+def recount_command(dry_run):
+    """Repair the product counts stored on the categories."""
+    drifted = recount_products()
+    for category_id, name, stored, actual in drifted:
+        click.echo(f'category {category_id} {name!r}: {stored} -> {actual}')
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    click.echo(f'{len(drifted)} categor{"y" if len(drifted) == 1 else "ies"} {"off" if dry_run else "fixed"}', err=True)
+
+@click.command('create-db')
+@with_appcontext
+def create_db_command():
+    """Create the tables of a new database and stamp it with the latest migration."""
+    from flask_migrate import stamp
+    db.create_all()
+    stamp() # so a later flask db upgrade only runs the migrations written after today
+    click.echo(f'tables created in {db.engine.url.render_as_string(hide_password=True)}')
+
+@maintenance_cli.command('run')
+@click.option('--dry-run', is_flag=True, help='Only count what would be purged and the free pages.')
+@click.option('--full-vacuum', is_flag=True, help='Rewrite the whole SQLite file, needed once for files made before SQLITE_AUTO_VACUUM. Blocks writers while it runs.')
+@click.option('--max-seconds', type=float, help='Time budget for the purges, MAINTENANCE_MAX_SECONDS by default.')
+def maintenance_command(dry_run, full_vacuum, max_seconds):
+    """Purge abandoned carts and orphaned cart items, then ANALYZE and vacuum the database."""
+    report = run_maintenance(dry_run=dry_run, full_vacuum=full_vacuum, max_seconds=max_seconds)
+    for line in format_report(report):
+        click.echo(line)
+    click.echo(f'{sum(counts["seconds"] for counts in report.values()):.2f}s{" (dry run)" if dry_run else ""}', err=True)
+
+def init_cli(app):
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(maintenance_cli)
+    app.cli.add_command(create_db_command)
@@ -0,0 +1,50 @@
+import os
+from sqlalchemy import event
+
+# engine profile, every setting can be overridden from the environment
+# SQLite defaults to a rollback journal with no busy timeout, so with several workers a writer blocks every reader
+# and a second writer fails straight away with "database is locked". WAL lets readers carry on during a write,
+# busy_timeout makes writers queue instead of failing, and synchronous=NORMAL is safe in WAL mode.
+
+def sqlite_pragmas():
+    return {
+        'auto_vacuum': os.getenv('SQLITE_AUTO_VACUUM', 'INCREMENTAL'), # lets maintenance hand free pages back a few at a time, applies to new files or after a full VACUUM
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)), # milliseconds a writer waits for the lock
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)), # negative means KiB, so 64MB of page cache per connection
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)), # read up to 256MB of the file through memory mapping
+        'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'), # sorts and temporary indexes stay off disk
+        'foreign_keys': os.getenv('SQLITE_FOREIGN_KEYS', 'OFF'),
+        'analysis_limit': int(os.getenv('SQLITE_ANALYSIS_LIMIT', 1000)) # rows per index ANALYZE samples, 0 reads them all
+    }
+
+def engine_options(uri):
+    if uri in ('sqlite://', 'sqlite:///:memory:'):
+        return {} # in-memory databases live on a single connection, nothing to pool
+    if uri.startswith('sqlite'):
+        # connections are cheap but pragmas are per connection, so keep a small pool of ready ones per worker
+        return {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30))
+        }
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)), # drop connections before the server times them out
+        'pool_pre_ping': True # check a connection is still alive before handing it out
+    }
+
+def configure_sqlite(engine, pragmas):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if value is not None and value != '':
+                cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -0,0 +1,75 @@
+from flask import current_app
+from sqlalchemy import event
+from app import db
+from app.cache import CatalogCache
+from app.models import User
+
+# the logged in user, cached so a request doesn't SELECT the user row just to know who is browsing.
+# load_user hands flask-login a SessionUser built from a cached (id, username, admin) row that is reloaded
+# at most every USER_CACHE_TTL seconds. Changing or deleting a user drops the entry when the transaction
+# commits, so a revoked admin loses access on their next request in this worker, and within the TTL in others
+# (straight away in all of them with a shared CATALOG_CACHE_BACKEND).
+
+user_cache = CatalogCache('user') # same backend settings as the catalog cache, but its own namespace and counters
+
+class SessionUser:
+    def __init__(self, id, username, admin):
+        self.id = id
+        self.username = username
+        self.admin = admin
+
+    @property
+    def is_authenticated(self):
+        return True
+    @property
+    def is_active(self):
+        return True
+    @property
+    def is_anonymous(self):
+        return False
+    def get_id(self):
+        return str(self.id)
+
+    def is_admin(self):
+        return self.admin
+
+def load_session_user(user_id):
+    def load():
+        row = db.session.query(User.id, User.username, User.admin).filter(User.id == user_id).first()
+        return tuple(row) if row else None
+    ttl = current_app.config.get('USER_CACHE_TTL', 30)
+    row = user_cache.get_or_load(f'user:{user_id}', load, ttl=ttl) if ttl else load()
+    return SessionUser(*row) if row else None
+
+
+# invalidation, collected on flush and applied once the transaction commits like the catalog cache
+def collect_user_changes(session, flush_context):
+    changed = session.info.setdefault('user_changes', set())
+    for obj in session.dirty:
+        if isinstance(obj, User) and session.is_modified(obj):
+            changed.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+def forget_users(session, user_ids=None):
+    # for users changed with UPDATE or DELETE statements, which skip the flush events. None means any user may have changed
+    if user_ids is None:
+        session.info['user_changes_all'] = True
+    else:
+        session.info.setdefault('user_changes', set()).update(user_ids)
+
+def apply_user_changes(session):
+    changed = session.info.pop('user_changes', None)
+    if session.info.pop('user_changes_all', False):
+        user_cache.clear()
+    elif changed:
+        user_cache.delete(*[f'user:{user_id}' for user_id in changed])
+
+def discard_user_changes(session):
+    session.info.pop('user_changes', None)
+    session.info.pop('user_changes_all', None)
+
+event.listen(db.session, 'after_flush', collect_user_changes)
+event.listen(db.session, 'after_commit', apply_user_changes)
+event.listen(db.session, 'after_rollback', discard_user_changes)
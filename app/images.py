@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, url_for
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow is optional, without it uploads are stored but listings show the originals
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# product image storage
+# uploads are saved under the sha256 of their content, so two products can't overwrite each other's image and
+# uploading the same file twice stores it once. Resized WebP and JPEG copies for the listing grids are made
+# in a small thread pool after the request has returned, until they exist templates fall back to the original.
+#
+#   images/<sha256>.<ext>                        the upload, served on the product page
+#   images/variants/<sha256>-<width>.webp|jpg    one per IMAGE_VARIANT_WIDTHS entry, served in the grids
+
+VARIANT_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+STORED_NAME = re.compile(r'[0-9a-f]{64}\.[a-z0-9]{1,5}') # what store_bytes returns, no directories
+RESIZABLE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'} # the other allowed uploads (txt, pdf) are kept as they are
+
+def store_upload(upload, folder):
+    return store_bytes(upload.read(), upload.filename.rsplit('.', 1)[1].lower(), folder)
+
+def store_file(path, folder):
+    with open(path, 'rb') as file:
+        data = file.read()
+    return store_bytes(data, path.rsplit('.', 1)[1].lower(), folder)
+
+def store_bytes(data, extension, folder):
+    name = f'{hashlib.sha256(data).hexdigest()}.{extension}'
+    path = os.path.join(folder, name)
+    if not os.path.exists(path): # same content, same name, nothing to write
+        os.makedirs(folder, exist_ok=True)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path) # readers never see a half written file
+    return name
+
+def is_stored_name(name):
+    # image names coming from clients must be one store_bytes made, anything else could point outside UPLOAD_FOLDER
+    return isinstance(name, str) and STORED_NAME.fullmatch(name) is not None
+
+def inside(folder, path):
+    folder = os.path.realpath(folder)
+    return os.path.commonpath([folder, os.path.realpath(path)]) == folder
+
+def variant_widths(config):
+    return sorted(int(width) for width in str(config.get('IMAGE_VARIANT_WIDTHS', '320,640')).split(',') if width.strip())
+
+def variant_name(name, width, extension):
+    return f'variants/{name.rsplit(".", 1)[0]}-{width}.{extension}'
+
+def make_variants(source, folder, widths, quality):
+    # runs on a worker thread, no app context here so everything it needs is passed in
+    try:
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            name = os.path.basename(source)
+            os.makedirs(os.path.join(folder, 'variants'), exist_ok=True)
+            for width in widths:
+                resized = image.copy()
+                resized.thumbnail((min(width, image.width), image.height)) # keeps the aspect ratio, never upscales
+                for extension, image_format in VARIANT_FORMATS:
+                    path = os.path.join(folder, variant_name(name, width, extension))
+                    temp_path = f'{path}.{threading.get_ident()}.tmp'
+                    output = resized.convert('RGB') if image_format == 'JPEG' else resized # JPEG has no alpha channel
+                    output.save(temp_path, image_format, quality=quality)
+                    os.replace(temp_path, path)
+    except Exception:
+        logger.exception('could not make image variants for %s', source)
+
+class ImagePipeline:
+    def __init__(self):
+        self.executor = None
+        self.ready = set() # names whose variants are all on disk, saves a stat per card once they are
+        self.lock = threading.Lock()
+
+    def submit(self, name):
+        if Image is None or name.rsplit('.', 1)[-1] not in RESIZABLE_EXTENSIONS:
+            return None
+        if self.has_variants(name): # identical upload, its variants were made the first time
+            return None
+        config = current_app.config
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=config.get('IMAGE_WORKERS', 2), thread_name_prefix='images')
+        folder = config['UPLOAD_FOLDER']
+        return self.executor.submit(make_variants, os.path.join(folder, name), folder, variant_widths(config), config.get('IMAGE_QUALITY', 80))
+
+    def has_variants(self, name):
+        if name in self.ready:
+            return True
+        last = variant_name(name, variant_widths(current_app.config)[-1], VARIANT_FORMATS[-1][0])
+        if not os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], last)): # written last, so every other variant is there too
+            return False
+        self.ready.add(name)
+        return True
+
+    def variants(self, name):
+        # srcsets for a listing card, or None while the variants are still being made
+        if Image is None or not name or name.rsplit('.', 1)[-1] not in RESIZABLE_EXTENSIONS or not self.has_variants(name):
+            return None
+        widths = variant_widths(current_app.config)
+        srcsets = {}
+        for extension, image_format in VARIANT_FORMATS:
+            srcsets[extension] = ', '.join(
+                f'{url_for("static", filename="images/" + variant_name(name, width, extension))} {width}w' for width in widths
+            )
+        srcsets['src'] = url_for('static', filename='images/' + variant_name(name, widths[0], 'jpg'))
+        return srcsets
+
+    def remove(self, name):
+        folder = current_app.config['UPLOAD_FOLDER']
+        paths = [os.path.join(folder, name)]
+        for width in variant_widths(current_app.config):
+            for extension, image_format in VARIANT_FORMATS:
+                paths.append(os.path.join(folder, variant_name(name, width, extension)))
+        for path in paths:
+            if not inside(folder, path): # a name with ../ or an absolute path, never delete outside the folder
+                logger.warning('not removing %s, it is outside %s', path, folder)
+                continue
+            if os.path.exists(path):
+                os.remove(path)
+        self.ready.discard(name)
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,227 @@
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from flask import current_app
+from app import db
+from app.models import Product, User, Cart, CartItem, utcnow
+
+try:
+    import fcntl
+except ImportError: # no flock on Windows, every worker there runs its own maintenance
+    fcntl = None
+
+# housekeeping for the cart tables and the database file, run by `flask maintenance run` (from cron or a timer)
+# or in process every MAINTENANCE_INTERVAL seconds by maintenance_scheduler.
+# carts are made on the first add to cart and nothing removed them, and with foreign keys off (the SQLite default)
+# deleted products and users left their cart lines behind. A run purges, CART_PURGE_BATCH rows at a time with a
+# commit per batch so no write lock is held for long, and stops once MAINTENANCE_MAX_SECONDS are used up:
+# - cart lines whose product or cart is gone
+# - carts untouched for CART_STALE_DAYS, empty carts untouched for EMPTY_CART_HOURS and carts of deleted users
+# then refreshes the planner statistics (ANALYZE) and hands up to VACUUM_PAGES free pages back to the file system
+# with an incremental VACUUM. Every step reports what it reclaimed and the time it took.
+
+logger = logging.getLogger(__name__)
+
+NO_SYNC = {'synchronize_session': False} # nothing purged is loaded in the session
+
+def orphaned_item():
+    return ~db.exists().where(Product.id == CartItem.product_id) | ~db.exists().where(Cart.id == CartItem.cart_id)
+
+def abandoned_cart(stale_before, empty_before):
+    # Cart.updated_at is only kept to the hour, so EMPTY_CART_HOURS below 1 could purge a cart being filled
+    return (
+        (Cart.updated_at < stale_before)
+        | ((Cart.updated_at < empty_before) & ~db.exists().where(CartItem.cart_id == Cart.id))
+        | ~db.exists().where(User.id == Cart.user_id)
+    )
+
+def purge_in_batches(column, condition, delete, batch_size, deadline):
+    # picks the ids matching condition batch_size at a time and commits delete(ids) for each batch. The DELETEs
+    # check the condition again, so a cart that got an item since it was picked is kept.
+    # returns the summed counts and whether nothing matching is left
+    totals = Counter()
+    while time.perf_counter() < deadline:
+        ids = db.session.scalars(db.select(column).where(condition).order_by(column).limit(batch_size)).all()
+        if ids:
+            totals.update(delete(ids))
+            db.session.commit()
+        if len(ids) < batch_size:
+            return totals, True
+    return totals, False
+
+def purge_orphaned_items(batch_size, deadline, dry_run=False):
+    if dry_run:
+        return {'items': db.session.scalar(db.select(db.func.count(CartItem.id)).where(orphaned_item()))}
+
+    def delete(ids):
+        result = db.session.execute(db.delete(CartItem).where(CartItem.id.in_(ids), orphaned_item()), execution_options=NO_SYNC)
+        return {'items': result.rowcount}
+
+    totals, finished = purge_in_batches(CartItem.id, orphaned_item(), delete, batch_size, deadline)
+    return {'items': totals['items'], 'finished': finished}
+
+def purge_abandoned_carts(stale_before, empty_before, batch_size, deadline, dry_run=False):
+    condition = abandoned_cart(stale_before, empty_before)
+    if dry_run:
+        carts = db.select(Cart.id).where(condition)
+        return {
+            'carts': db.session.scalar(db.select(db.func.count()).select_from(carts.subquery())),
+            'items': db.session.scalar(db.select(db.func.count(CartItem.id)).where(CartItem.cart_id.in_(carts)))
+        }
+
+    def delete(ids):
+        carts = db.select(Cart.id).where(Cart.id.in_(ids), condition)
+        items = db.session.execute(db.delete(CartItem).where(CartItem.cart_id.in_(carts)), execution_options=NO_SYNC)
+        result = db.session.execute(db.delete(Cart).where(Cart.id.in_(ids), condition), execution_options=NO_SYNC)
+        return {'carts': result.rowcount, 'items': items.rowcount}
+
+    totals, finished = purge_in_batches(Cart.id, condition, delete, batch_size, deadline)
+    return {'carts': totals['carts'], 'items': totals['items'], 'finished': finished}
+
+def analyze():
+    # fresh statistics for the query planner after the purges changed the table sizes. SQLite connections
+    # have analysis_limit set (SQLITE_ANALYSIS_LIMIT), so it samples that many rows per index instead of reading them all
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('ANALYZE')
+        connection.commit()
+    return {}
+
+def vacuum(pages, full=False, dry_run=False):
+    # deleted rows leave free pages inside the SQLite file. With auto_vacuum=INCREMENTAL (SQLITE_AUTO_VACUUM) an
+    # incremental VACUUM moves up to `pages` of them to the end and truncates the file. A file made before that
+    # setting needs one full VACUUM first, which rewrites the whole file and blocks writers while it runs.
+    # PostgreSQL's autovacuum does this on its own
+    if db.engine.dialect.name != 'sqlite':
+        return {}
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT') # VACUUM can't run in a transaction
+
+        def pragma(name):
+            return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+        page_size, free_before = pragma('page_size'), pragma('freelist_count')
+        if dry_run:
+            return {'free pages': free_before}
+        if full:
+            connection.exec_driver_sql('VACUUM') # also switches the file to the auto_vacuum mode the connection set
+        elif pragma('auto_vacuum') == 2: # incremental
+            # the pragma frees one page per step and returns no rows, so a plain execute (one step) would free a single
+            # page. executescript steps it to the end, freelist_count below tells what it freed
+            connection.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+        free_after = pragma('freelist_count')
+    return {'pages': free_before - free_after, 'bytes': (free_before - free_after) * page_size, 'free pages': free_after}
+
+def run_maintenance(dry_run=False, full_vacuum=False, max_seconds=None):
+    # one pass of every task, returns {task: {what: count, ..., 'seconds': ...}}
+    config = current_app.config
+    now = utcnow()
+    deadline = time.perf_counter() + (config['MAINTENANCE_MAX_SECONDS'] if max_seconds is None else max_seconds)
+    batch_size = config['CART_PURGE_BATCH']
+    tasks = (
+        ('orphaned cart items', lambda: purge_orphaned_items(batch_size, deadline, dry_run)),
+        ('abandoned carts', lambda: purge_abandoned_carts(
+            now - timedelta(days=config['CART_STALE_DAYS']), now - timedelta(hours=config['EMPTY_CART_HOURS']),
+            batch_size, deadline, dry_run
+        )),
+        ('analyze', lambda: {} if dry_run else analyze()),
+        ('vacuum', lambda: vacuum(config['VACUUM_PAGES'], full_vacuum, dry_run))
+    )
+    report = {}
+    for name, task in tasks:
+        start = time.perf_counter()
+        report[name] = dict(task(), seconds=round(time.perf_counter() - start, 3))
+    return report
+
+def format_report(report):
+    lines = []
+    for name, counts in report.items():
+        counted = ', '.join(f'{value} {what}' for what, value in counts.items() if what not in ('seconds', 'finished'))
+        line = f'{name}: {counted or "done"} in {counts["seconds"]:.2f}s'
+        if counts.get('finished') is False:
+            line += ' (out of time, the rest is left for the next run)'
+        lines.append(line)
+    return lines
+
+@contextmanager
+def claim_run(uri, interval):
+    # every worker process has its own scheduler. On one host a lock file named after the database lets only one
+    # of them run at a time and records when the last run finished, so the others skip theirs until it is due.
+    # yields whether this process should run now
+    if fcntl is None:
+        yield True
+        return
+    path = os.path.join(tempfile.gettempdir(), f'microstore-maintenance-{zlib.crc32(uri.encode()):08x}.lock')
+    with open(path, 'a+') as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError: # another worker is running it right now
+            yield False
+            return
+        try:
+            file.seek(0)
+            last = float(file.read() or 0)
+            due = time.time() - last >= interval / 2
+            yield due
+            if due:
+                file.seek(0)
+                file.truncate()
+                file.write(str(time.time()))
+                file.flush()
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+class MaintenanceScheduler:
+    def __init__(self):
+        self.thread = None
+        self.pid = None # process that started the thread
+        self.stopped = threading.Event()
+        self.last_report = None
+        self.lock = threading.Lock()
+
+    def start(self, app):
+        # one thread per process, started from the first request (or ASGI startup) rather than from create_app:
+        # with gunicorn --preload the app is built in the master, and threads don't survive the fork into the workers
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, args=(app,), name='maintenance', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, app):
+        interval = app.config['MAINTENANCE_INTERVAL']
+        # jittered so workers started together don't all wake up at once
+        while not self.stopped.wait(interval * random.uniform(0.9, 1.1)):
+            with app.app_context():
+                try:
+                    with claim_run(app.config['SQLALCHEMY_DATABASE_URI'], interval) as due:
+                        if due:
+                            self.last_report = run_maintenance()
+                            for line in format_report(self.last_report):
+                                logger.info('maintenance %s', line)
+                except Exception:
+                    logger.exception('maintenance run failed')
+                finally:
+                    db.session.remove()
+
+maintenance_scheduler = MaintenanceScheduler()
+
+def init_maintenance(app):
+    if not app.config.get('MAINTENANCE_INTERVAL'):
+        return
+
+    @app.before_request
+    def start_maintenance():
+        maintenance_scheduler.start(app) # a pid check after the first request of each worker
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from flask import g, request, has_request_context, before_render_template, template_rendered, Response
+from sqlalchemy import event
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# per route request metrics: latency, SQL statement count, time spent in the database and in templates
+#   METRICS_ENABLED=1       record them and serve /metrics in the Prometheus text format
+#   SLOW_QUERY_MS=200       log every statement slower than this (works without METRICS_ENABLED), 0 is off
+# nothing is hooked up when both are off, so a disabled setup pays nothing per request or per statement.
+# every worker process keeps its own numbers, Prometheus adds them up across the scraped workers.
+# series are keyed by the route rule (/product/<int:id>), not the path, so their number stays bounded
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {} # (route, method) -> [count per bucket..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1 # +Inf, i.e. the count
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted(self.series.items())
+            items = [(labels, list(series)) for labels, series in items]
+        for (route, method), series in items:
+            labels = f'route="{route}",method="{method}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{labels}}} {series[-2]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series[-1]}')
+        return lines
+
+request_seconds = Histogram('microstore_request_seconds', 'Request latency.', SECONDS_BUCKETS)
+request_queries = Histogram('microstore_request_queries', 'SQL statements per request.', QUERY_BUCKETS)
+request_db_seconds = Histogram('microstore_request_db_seconds', 'Time per request spent in SQL statements.', SECONDS_BUCKETS)
+request_render_seconds = Histogram('microstore_request_render_seconds', 'Time per request spent rendering templates.', SECONDS_BUCKETS)
+HISTOGRAMS = (request_seconds, request_queries, request_db_seconds, request_render_seconds)
+slow_query_seconds = None # set from SLOW_QUERY_MS by init_metrics
+timing_queries = False # whether init_metrics hooked up the statement timers
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'request_metrics' in g:
+        g.request_metrics['queries'] += 1
+        g.request_metrics['db'] += elapsed
+    if slow_query_seconds and elapsed >= slow_query_seconds:
+        logger.warning('slow query (%.1f ms): %s %r', elapsed * 1000, statement, parameters)
+
+def start_request():
+    g.request_metrics = {'start': time.perf_counter(), 'queries': 0, 'db': 0.0, 'render': 0.0, 'render_depth': 0}
+
+def record_request(error=None):
+    metrics = g.pop('request_metrics', None)
+    if metrics is None:
+        return
+    labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method)
+    request_seconds.observe(labels, time.perf_counter() - metrics['start'])
+    request_queries.observe(labels, metrics['queries'])
+    request_db_seconds.observe(labels, metrics['db'])
+    request_render_seconds.observe(labels, metrics['render'])
+
+def render_started(sender, template, context, **extra):
+    metrics = g.get('request_metrics')
+    if metrics is not None:
+        if not metrics['render_depth']: # product cards render inside the page, only time the outermost template
+            metrics['render_start'] = time.perf_counter()
+        metrics['render_depth'] += 1
+
+def render_finished(sender, template, context, **extra):
+    metrics = g.get('request_metrics')
+    if metrics is not None and metrics['render_depth']:
+        metrics['render_depth'] -= 1
+        if not metrics['render_depth']:
+            metrics['render'] += time.perf_counter() - metrics['render_start']
+
+def metrics_view():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def instrument_engine(engine):
+    # also used for engines made after startup, like the async one of the ASGI mode
+    if timing_queries:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+def init_metrics(app):
+    global slow_query_seconds, timing_queries
+    enabled = app.config.get('METRICS_ENABLED', False)
+    slow_query_ms = app.config.get('SLOW_QUERY_MS', 0)
+    if not (enabled or slow_query_ms):
+        return
+    with app.app_context():
+        engine = db.engine
+    slow_query_seconds = slow_query_ms / 1000 if slow_query_ms else None
+    timing_queries = True
+    instrument_engine(engine)
+    if enabled:
+        app.before_request_funcs.setdefault(None, []).insert(0, start_request) # first, so the other hooks are timed too
+        app.teardown_request(record_request)
+        before_render_template.connect(render_started, app)
+        template_rendered.connect(render_finished, app)
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
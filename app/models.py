@@ -3,17 +3,42 @@ from wtforms import StringField, DecimalField, SelectField, FileField, Validatio
 from wtforms.validators import NumberRange, EqualTo, InputRequired
 from flask_wtf.file import FileRequired
 from flask_wtf import FlaskForm
-from werkzeug.security import generate_password_hash, check_password_hash
-from decimal import Decimal
+from app.passwords import hash_password, verify_password, needs_rehash
+from decimal import Decimal, ROUND_HALF_UP
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from app import db
 
+# money is stored as integer cents and only turned into Decimal for display and forms
+def decimal_to_cents(value):
+    return int((Decimal(str(value)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+def cents_to_decimal(cents):
+    return Decimal(int(cents)).scaleb(-2) # 1250 -> Decimal('12.50')
+
+# names are compared case-folded with surrounding whitespace dropped, so 'Shoes ' and 'shoes' count as the same
+def normalize_name(value):
+    return (value or '').strip().casefold()
+
+# timestamps are stored as naive UTC
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def upsert(model):
+    # INSERT ... ON CONFLICT for the database in use, SQLite and PostgreSQL spell it the same way
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
 # custom validators 
 def check_duplicate_categories(case_sensitive=True):
     def check_duplicate(form, field):
+        # exact lookups served by ix_category_name / ix_category_name_key, a LIKE '%...%' would scan every category
         if case_sensitive:
-            category_query = Category.query.filter(Category.name.like('%' + field.data + '%')).first() # check if category exists
+            category_query = db.session.query(Category.id).filter(Category.name == field.data).first() # check if category exists
         else:
-            category_query = Category.query.filter(Category.name.ilike('%' + field.data + '%')).first()
+            category_query = db.session.query(Category.id).filter(Category.name_key == normalize_name(field.data)).first()
         if category_query:
             raise ValidationError(f'Category {field.data} exists already.')
     return check_duplicate
@@ -24,7 +49,7 @@ class NameForm(FlaskForm):
     name = StringField('Name', validators=[InputRequired()]) # requires user to input
 
 class CategoryForm(FlaskForm):
-    name = StringField('Name', validators=[InputRequired(), check_duplicate_categories()]) # requires user to input and must not be duplicate category name
+    name = StringField('Name', validators=[InputRequired(), check_duplicate_categories(case_sensitive=False)]) # requires user to input and must not be duplicate category name
 
 class ProductForm(NameForm):
     price = DecimalField('Product Price', validators=[InputRequired(), NumberRange(min=Decimal('0.01'))]) # allow numbers minimum of 0.01
@@ -54,39 +79,63 @@ class AdminUserUpdateform(FlaskForm):
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True) # make id the primary key
     name = db.Column(db.String(255), nullable=False) # max input of 255 characters, must contain something
-    price = db.Column(db.Float, nullable=False) # allow decimal numbers, must contain something
+    price_cents = db.Column(db.Integer, nullable=False) # price in cents, integers keep money exact and let SQL do the sums
     image_path = db.Column(db.String(255), nullable=False) # max input of 255 characters, must contain something
     description = db.Column(db.String(1000), nullable=False, default='No description available') # max input of 1000 characters, must contain something
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id')) # foreign key link to category table
+    # foreign key link to category table. active_history loads the old value before a change to an expired product,
+    # so the category counters (app/catalog.py) always see which category a product left
+    category_id = db.column_property(db.Column(db.Integer, db.ForeignKey('category.id')), active_history=True)
     category = db.relationship('Category', backref=db.backref('products', lazy='dynamic')) # establish relationship with category table
 
+    __table_args__ = (
+        db.Index('ix_product_listing', 'category_id', 'price_cents', 'id'), # serves the ordered, keyset paginated /products listing
+        # AUTOINCREMENT: SQLite would otherwise hand the id of a deleted newest product to the next one, and the
+        # id pools (app/catalog.py) only look above the highest id they have seen
+        {'sqlite_autoincrement': True}
+    )
+
     def __init__(self, name, price, category, image_path, description):
         self.name = name
         self.price = price
         self.category = category
         self.image_path = image_path
         self.description = description
-        
+
+    @property
+    def price(self):
+        return cents_to_decimal(self.price_cents)
+
+    @price.setter
+    def price(self, value):
+        self.price_cents = decimal_to_cents(value)
 
     def __repr__(self):
         return '<Product %d>' % self.id
     
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True) # make id the primary key
-    name = db.Column(db.String(100), nullable=False) # max input of 100 characters, must contain something
+    name = db.Column(db.String(100), nullable=False, index=True) # max input of 100 characters, must contain something
+    name_key = db.Column(db.String(100), nullable=False, unique=True, index=True) # normalize_name(name), kept in sync by the validator below
+    product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0') # products in this category, maintained by app.catalog on every flush
 
     def __init__(self, name):
         self.name = name
 
+    @db.validates('name')
+    def set_name_key(self, key, name):
+        self.name_key = normalize_name(name)
+        return name
+
     def __repr__(self):
         return '<Category %d>' % self.id
 
 # user model
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # make id the primary key
-    username = db.Column(db.String(100), nullable=False) # max 100 characters, must contain something
+    username = db.Column(db.String(100), nullable=False, unique=True, index=True) # max 100 characters, must contain something, login looks users up by it
+    username_key = db.Column(db.String(100), nullable=False, unique=True, index=True) # normalize_name(username), stops 'Bob' registering next to 'bob'
     password_hash = db.Column(db.String()) # string only
-    admin = db.Column(db.Boolean()) # Boolean only (True and false)
+    admin = db.Column(db.Boolean(), nullable=False, default=False, index=True) # Boolean only (True and false, never NULL), indexed for the admin user list's role filter and sort
 
     @property
     def is_authenticated(self):
@@ -102,18 +151,33 @@ class User(db.Model):
     
     def __init__(self, username, password, admin):
         self.username = username
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password) # method and cost come from PASSWORD_HASH_METHOD
         self.admin = admin
 
+    @db.validates('username')
+    def set_username_key(self, key, username):
+        self.username_key = normalize_name(username)
+        return username
+
     def is_admin(self):
         return self.admin
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password) # check if password match
+        return verify_password(self.password_hash, password) # check if password match
+
+    def rehash_password(self, password):
+        # call with the password that just checked out, stores a new hash if the hash settings changed since it was made
+        if needs_rehash(self.password_hash):
+            self.password_hash = hash_password(password)
+            return True
+        return False
     
+CART_TOUCH_INTERVAL = timedelta(hours=1)
+
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True) # make id the primary key
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, index=True) # one cart per user, every cart route looks it up by user
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, index=True) # last change to the cart, to the hour (see touch), maintenance purges carts left untouched for too long
 
     user = db.relationship('User', backref=db.backref('cart', lazy='select')) # create relationship with User and back to Cart again
     items = db.relationship('CartItem', backref=db.backref('cart', lazy='select'), cascade='all, delete-orphan', lazy='select') # new parameter cascade. It is useful as when we delete the Cart database table, all of CartItems will also be removed too.
@@ -121,60 +185,100 @@ class Cart(db.Model):
 
     def __init__(self, user_id):
         self.user_id = user_id
+        self.updated_at = utcnow()
+
+    def touch(self):
+        # called by every change to the items. The timestamp only has to be right to the hour,
+        # so a busy cart costs one UPDATE an hour (flushed with the caller's commit) instead of one per change
+        now = utcnow()
+        if self.updated_at is None or now - self.updated_at >= CART_TOUCH_INTERVAL:
+            self.updated_at = now
+
+    @classmethod
+    def for_user(cls, user_id):
+        cart = cls.query.filter_by(user_id=user_id).first()
+        if not cart: # create a cart if it is a new user, flushed so it has an id but committed with the rest of the request
+            cart = cls(user_id=user_id)
+            db.session.add(cart)
+            db.session.flush()
+        return cart
 
     def add_item(self, product, quantity=1):
-        cart_item = CartItem.query.filter_by(cart_id=self.id, product_id=product.id).first()
-        if cart_item: # checks if item is a duplicate or not. If it is, just add the item by 1
-            cart_item.quantity += quantity
-        else:
-            cart_item = CartItem(self.id, product.id, quantity) # if not it is a new item so commit the item into database as new entry
-            db.session.add(cart_item)
+        product_id = product.id if hasattr(product, 'id') else product
+        # one INSERT ... ON CONFLICT DO UPDATE, the database adds to the stored quantity itself
+        # so concurrent add to cart clicks can't overwrite each other's increments
+        stmt = upsert(CartItem).values(cart_id=self.id, product_id=product_id, quantity=quantity)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.product_id],
+            set_={'quantity': CartItem.quantity + stmt.excluded.quantity}
+        )
+        db.session.execute(stmt)
+        self.touch()
 
     def remove_item(self, product, quantity=1):
         product_id = product.id if hasattr(product, 'id') else product
-        cart_item = CartItem.query.filter_by(cart_id=self.id, product_id=product_id).first()
-        if not cart_item:
-            return None
+        item = (CartItem.cart_id == self.id) & (CartItem.product_id == product_id)
+        # decrement in place, then drop the row if it went to zero or below
+        result = db.session.execute(db.update(CartItem).where(item).values(quantity=CartItem.quantity - int(quantity)))
+        if not result.rowcount:
+            return False
+        db.session.execute(db.delete(CartItem).where(item, CartItem.quantity <= 0))
+        self.touch()
+        return True
+    
+    def set_quantities(self, quantities):
+        # {product_id: quantity} for many lines at once: one multi-row upsert for the lines to keep and one
+        # DELETE for the ones set to zero or less, committed by the caller as a single transaction
+        keep = [{'cart_id': self.id, 'product_id': product_id, 'quantity': quantity}
+                for product_id, quantity in quantities.items() if quantity > 0]
+        drop = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        if keep:
+            stmt = upsert(CartItem).values(keep)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CartItem.cart_id, CartItem.product_id],
+                set_={'quantity': stmt.excluded.quantity}
+            )
+            db.session.execute(stmt)
+        if drop:
+            db.session.execute(db.delete(CartItem).where(CartItem.cart_id == self.id, CartItem.product_id.in_(drop)))
+        self.touch()
 
-        # ensure quantity is an int and compute new quantity
-        qty = int(quantity)
-        new_qty = cart_item.quantity - qty
+    def get_items(self):
+        return self.summary()[0]
 
-        if new_qty > 0:
-            cart_item.quantity = new_qty
-        else:
-            # remove item when quantity goes to zero or below
-            db.session.delete(cart_item)
+    @property
+    def total(self):
+        total_cents = db.session.query(db.func.sum(Product.price_cents * CartItem.quantity)) \
+            .join(Product, CartItem.product).filter(CartItem.cart_id == self.id).scalar()
+        return cents_to_decimal(total_cents or 0)
 
-        return cart_item
-    
-    def get_items(self):
+    def summary(self):
+        # every line with its product and subtotal plus the cart total in one query, the total is a window SUM
+        # over the same rows so the cost doesn't depend on how many items are in the cart
+        subtotal = Product.price_cents * CartItem.quantity
+        rows = db.session.query(Product, CartItem.quantity, subtotal, db.func.sum(subtotal).over()) \
+            .join(CartItem.product).filter(CartItem.cart_id == self.id).order_by(CartItem.id).all()
         items_list = []
-        for cart_item in self.items:
+        for product, quantity, subtotal_cents, total_cents in rows:
             items_list.append({
-                'product': cart_item.product,
-                'quantity': cart_item.quantity,
-                'subtotal': cart_item.subtotal
+                'product': product,
+                'quantity': quantity,
+                'subtotal': cents_to_decimal(subtotal_cents)
             })
-        return items_list
+        total = cents_to_decimal(rows[0][3] if rows else 0)
+        return items_list, total
 
-    @property
-    def total(self):
-        total = Decimal('0.00')
-        for item in self.items:
-            total += item.subtotal
-        return total
-
-        
-            
-    
 class CartItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     cart_id = db.Column(db.Integer, db.ForeignKey('cart.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True) # cart_id lookups use uq_cart_item_cart_product, this one serves joins and deletes by product
     quantity = db.Column(db.Integer, nullable=False, default=1)
 
     product = db.relationship('Product') 
+
+    __table_args__ = (
+        db.UniqueConstraint('cart_id', 'product_id', name='uq_cart_item_cart_product'), # one row per product in a cart, add_item upserts against it
+    )
     # create relationship with Product model. Will need to use later to refer to this database for price of items
     # no need back reference because product would not need to access cartitem model anyways.
 
@@ -185,9 +289,9 @@ class CartItem(db.Model):
 
     @property
     def subtotal(self):
-        price = getattr(self.product, 'price', None)
-        if price is None:
+        price_cents = getattr(self.product, 'price_cents', None)
+        if price_cents is None:
             return Decimal('0.00')
         else:
-            return Decimal(str(price)) * Decimal(self.quantity)
+            return cents_to_decimal(price_cents * self.quantity)
 
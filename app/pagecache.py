@@ -0,0 +1,67 @@
+import hashlib
+from functools import wraps
+from flask import current_app, request, session, make_response, render_template, Response
+from flask_login import current_user
+from markupsafe import Markup
+from app.cache import catalog_cache
+
+# rendered catalog pages and product cards, stored in the catalog cache under the catalog version token,
+# so any product or category change makes every cached page and card miss on its next request.
+# whole pages are only cached for anonymous visitors, logged in users see their name, cart and admin links.
+# PAGE_CACHE_TTL bounds how long another worker's change can go unnoticed, 0 turns both caches off
+
+def page_cache_ttl():
+    return current_app.config.get('PAGE_CACHE_TTL', 60)
+
+def page_cache_key():
+    # the cache key for this request's page, or None when it has to be rendered for this visitor
+    if not page_cache_ttl() or request.method != 'GET' or current_user.is_authenticated or '_flashes' in session:
+        return None
+    return f'page:{catalog_cache.page_version()}:{request.full_path}' # route and every argument, path and query string
+
+def page_entry(response):
+    if response.status_code != 200 or session.modified: # redirects, errors and anything touching the session stay uncached
+        return None
+    body = response.get_data()
+    return {'body': body, 'mimetype': response.mimetype, 'etag': hashlib.sha1(body).hexdigest()}
+
+def conditional_page(entry, response=None):
+    if response is None:
+        response = Response(entry['body'], mimetype=entry['mimetype'])
+    response.set_etag(entry['etag'])
+    response.cache_control.no_cache = True # browsers may keep it but ask first, an unchanged page is a 304 without a body
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+def cached_page(view):
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        key = page_cache_key()
+        if key is None:
+            return view(*args, **kwargs)
+
+        rendered = {}
+        def load():
+            response = make_response(view(*args, **kwargs))
+            rendered['response'] = response
+            return page_entry(response)
+
+        entry = catalog_cache.get_or_load(key, load, ttl=page_cache_ttl())
+        if entry is None:
+            return rendered['response']
+        return conditional_page(entry, rendered.get('response'))
+    return decorated_view
+
+def product_card(id, product):
+    # one product card, the same markup on the homepage, the listing and search. The buttons depend on who is
+    # looking, so there is a copy per kind of visitor
+    if current_user.is_authenticated:
+        viewer = 'admin' if current_user.admin else 'user'
+    else:
+        viewer = 'anonymous'
+    render = lambda: Markup(render_template('product card.html', id=id, product=product))
+    ttl = page_cache_ttl()
+    if not ttl:
+        return render()
+    key = f'card:{catalog_cache.page_version()}:{id}:{viewer}'
+    return catalog_cache.get_or_load(key, render, ttl=ttl)
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# password hashing with a configurable method and cost
+#   PASSWORD_HASH_METHOD     werkzeug method string, e.g. 'scrypt', 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'
+#   PASSWORD_SALT_LENGTH     salt characters
+#   PASSWORD_HASH_WORKERS    threads hashing may run on at once, 0 hashes on the request thread
+# a hash made with other settings still verifies, login stores a new one the next time the password is typed in.
+# hashlib's scrypt and pbkdf2 release the GIL, so the pool runs hashes in parallel while capping how many cores
+# a burst of logins or sign ups can take from the rest of the requests
+
+DEFAULT_METHOD = 'scrypt'
+DEFAULT_SALT_LENGTH = 16
+
+def hash_settings():
+    if not has_app_context(): # e.g. a User made in a plain script
+        return DEFAULT_METHOD, DEFAULT_SALT_LENGTH
+    config = current_app.config
+    return config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD), config.get('PASSWORD_SALT_LENGTH', DEFAULT_SALT_LENGTH)
+
+class HashPool:
+    def __init__(self):
+        self.executor = None
+        self.workers = None
+        self.lock = threading.Lock()
+        self.methods = {} # configured method -> the full method string werkzeug writes into hashes
+
+    def run(self, func, *args):
+        workers = current_app.config.get('PASSWORD_HASH_WORKERS', 0) if has_app_context() else 0
+        if not workers:
+            return func(*args)
+        with self.lock:
+            if self.executor is None or self.workers != workers:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False) # the pool size was changed, let running hashes finish
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='passwords')
+                self.workers = workers
+        return self.executor.submit(func, *args).result()
+
+    def full_method(self, method):
+        # 'scrypt' is written as 'scrypt:32768:8:1', hash an empty password once to see what werkzeug expands it to
+        if method not in self.methods:
+            self.methods[method] = generate_password_hash('', method=method, salt_length=1).split('$', 1)[0]
+        return self.methods[method]
+
+hash_pool = HashPool()
+
+def hash_password(password):
+    method, salt_length = hash_settings()
+    return hash_pool.run(generate_password_hash, password, method, salt_length)
+
+def verify_password(password_hash, password):
+    if not password_hash:
+        return False
+    return hash_pool.run(check_password_hash, password_hash, password)
+
+def needs_rehash(password_hash):
+    method, salt_length = hash_settings()
+    stored_method, _, rest = (password_hash or '').partition('$')
+    stored_salt = rest.partition('$')[0]
+    return stored_method != hash_pool.full_method(method) or len(stored_salt) != salt_length
@@ -1,11 +1,26 @@
-import os
 from functools import wraps
-from flask import abort, render_template, flash, redirect, url_for, g, request
+from flask import Blueprint, current_app, abort, render_template, flash, redirect, url_for, g, request, jsonify, Response, stream_with_context
 from flask_login import current_user, login_user, logout_user, login_required
-from sqlalchemy.sql.expression import func
-from app import app, db, login_manager, ALLOWED_EXTENSIONS
-from app.models import Product, Category, User, Cart, ProductForm, CategoryForm, LoginForm, RegistrationForm, AdminUserCreateForm, AdminUserUpdateform # import the database model and forms
-from werkzeug.utils import secure_filename
+from app import db, login_manager, ALLOWED_EXTENSIONS
+from app.cache import catalog_cache
+from app.catalog import random_products, product_listing, product_details, category_choices
+from app.search import search_products
+from app.images import image_pipeline, store_upload
+from app.pagecache import cached_page, product_card
+from app.identity import load_session_user
+from app.accounts import BULK_ACTIONS, listing_options, listing_args, user_listing, users_csv, bulk_user_action
+from app.models import Product, Category, User, Cart, CartItem, cents_to_decimal, ProductForm, CategoryForm, LoginForm, RegistrationForm, AdminUserCreateForm, AdminUserUpdateform # import the database model and forms
+from sqlalchemy.exc import IntegrityError
+
+# the site's pages, one blueprint per part, registered by create_app
+catalog_pages = Blueprint('catalog', __name__) # storefront: frontpage, listings, search and product pages
+cart_pages = Blueprint('cart', __name__)
+auth_pages = Blueprint('auth', __name__) # register, login, logout
+admin_pages = Blueprint('admin', __name__) # catalog and user management
+blueprints = (catalog_pages, cart_pages, auth_pages, admin_pages)
+
+catalog_pages.add_app_template_global(image_pipeline.variants, 'image_variants') # resized srcsets for product grids, None until they are made
+catalog_pages.add_app_template_global(product_card, 'product_card') # cached product card fragment
 
 # custom decorators
 def admin_login_required(func):
@@ -20,24 +35,24 @@ def admin_login_required(func):
 # user initialisation
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return load_session_user(int(id)) # cached for USER_CACHE_TTL seconds, dropped when the user is changed or deleted
 
-@app.before_request
+@catalog_pages.before_app_request
 def get_current_user():
     g.user = current_user
 
 # frontpage index
-@app.route('/')
+@catalog_pages.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('homepage'))
+        return redirect(url_for('catalog.homepage'))
     return render_template('index.html', page_name='Frontpage')
 
 # user homepage
-@app.route('/homepage')
+@catalog_pages.route('/homepage')
 @login_required
 def homepage():
-    products = Product.query.order_by(func.random()).limit(9).all()
+    products = random_products(9) # sampled through the primary key index instead of ORDER BY random()
     products_show = {}
     for product in products:
         products_show[product.id] =  {
@@ -49,12 +64,13 @@ def homepage():
     return render_template('homepage.html', page_name='Homepage', products_show=products_show)
 
 # show all products
-@app.route('/products')
-@app.route('/products/<int:page>')
+@catalog_pages.route('/products')
+@catalog_pages.route('/products/<int:page>')
+@cached_page # anonymous visitors get the stored page (or a 304) until the catalog changes
 def products(page=1):
     per_page = 3
-    product_query = Product.query.order_by(Product.category_id, Product.price).all()
-    pagination = Product.query.paginate(page=page, per_page=per_page, error_out=False)
+    # keyset pagination, prev/next links carry the (category_id, price, id) of the edge product so deep pages cost the same as page 1
+    pagination = product_listing(per_page, page=page, after=request.args.get('after'), before=request.args.get('before'))
     products = pagination.items
     products_show = {}
     for product in products:
@@ -67,43 +83,74 @@ def products(page=1):
     return render_template('product view.html', page_name='Products', products_show=products_show, per_page=per_page, pagination=pagination)
     # return jsonify(products_show) # give all product lists
 
-# show specific product details
-@app.route('/product/<id>')
-def product(id):
-    product = Product.query.get_or_404(id)
+# full text search, ranked best match first
+@catalog_pages.route('/search')
+def search():
+    per_page = 12
+    query = request.args.get('q', '')
+    category_id = request.args.get('category', type=int)
+    results = search_products(query, per_page, category_id=category_id, after=request.args.get('after'))
     products_show = {}
-    products_show[product.id] =  {
-            'name': product.name,
-            'price': str(product.price), 
+    for product in results.items:
+        products_show[product.id] = {
+            'name': product.name, # product name
+            'price': str(product.price), # product price
             'category': product.category.name, # category name
-            'description': product.description,
-            'image_path': product.image_path
+            'image_path': product.image_path # string of image name
         }
-    return render_template('product page.html', page_name=f'{product.name}' ,products_show=products_show)
+    return render_template('search.html', page_name='Search', products_show=products_show, results=results,
+                           query=query, category_id=category_id, categories=category_choices())
+
+# same search as json for the typeahead, a handful of names per keystroke
+@catalog_pages.route('/search.json')
+def search_json():
+    per_page = max(1, min(request.args.get('limit', 8, type=int), 50))
+    results = search_products(request.args.get('q', ''), per_page,
+                              category_id=request.args.get('category', type=int), after=request.args.get('after'))
+    return jsonify({
+        'results': [{
+            'id': product.id,
+            'name': product.name,
+            'price': str(product.price),
+            'category': product.category.name,
+            'url': url_for('catalog.product', id=product.id)
+        } for product in results.items],
+        'next': results.next_cursor
+    })
+
+# show specific product details
+@catalog_pages.route('/product/<int:id>')
+@cached_page
+def product(id):
+    product = product_details(id) # served from the catalog cache after the first view
+    if product is None:
+        abort(404)
+    products_show = {id: product}
+    return render_template('product page.html', page_name=f'{product["name"]}' ,products_show=products_show)
 
 # show all categories
-@app.route('/admin/categories')
+@admin_pages.route('/admin/categories')
 @login_required
 @admin_login_required
 def categories_list_admin():
-    categories = Category.query.all()
+    # the counts are kept on the category rows (see app.catalog), so this reads the category table only
+    categories = db.session.query(Category.id, Category.name, Category.product_count).order_by(Category.id).all()
     category_data = []
-    for category in categories:
-        product_count = category.products.count()
+    for category_id, name, product_count in categories:
         category_data.append({
-            'id': category.id,
-            'name': category.name,
+            'id': category_id,
+            'name': name,
             'product_count': product_count
         })
     return render_template('category edit.html', categories=category_data)
 
 # show specific category details
-@app.route('/product-create', methods=['GET', 'POST'])
+@admin_pages.route('/product-create', methods=['GET', 'POST'])
 @login_required
 @admin_login_required
 def create_product():
     form = ProductForm()
-    categories = [(c.id, c.name) for c in Category.query.all()] # get all categories by id and name and put it into a list
+    categories = category_choices() # get all categories by id and name as a list, cached until a category changes
     form.category.choices = categories
     
     def allowed_file(filename):
@@ -114,18 +161,16 @@ def create_product():
         description = form.description.data # get inputted description
         category = Category.query.get_or_404(form.category.data) # get inputted category
         image = form.image.data # get uploaded image
-        if allowed_file(image.filename):
-            filename = secure_filename(image.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(filepath):
-                flash('Product image already exists. Try changing the image name.', 'warning') # if image name already exists, redirect user back to the product create page
-                return render_template('product create.html', page_name='Create a product',form=form)
-            image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename)) # store image into /static/images
+        if not allowed_file(image.filename):
+            flash('That file type is not allowed.', 'warning')
+            return render_template('product create.html', page_name='Create a product', form=form)
+        filename = store_upload(image, current_app.config['UPLOAD_FOLDER']) # named after its content, identical uploads share one file
+        image_pipeline.submit(filename) # grid sized variants are made in the background, the request doesn't wait
         product = Product(name, price, category, filename, description) # stage the changes
         db.session.add(product) # add staged changes into current session
         db.session.commit() # commit staged changes
         flash(f'Product {name} has successfully been created!', 'success')
-        return redirect(url_for('create_product')) # return user to frontpage
+        return redirect(url_for('admin.create_product')) # return user to frontpage
     
     if form.errors:
         flash(form.errors, 'danger') # show the error message
@@ -133,7 +178,7 @@ def create_product():
     return render_template('product create.html', page_name='Create a product', form=form)
 
 # create new category
-@app.route('/category-create', methods=['GET','POST'])
+@admin_pages.route('/category-create', methods=['GET','POST'])
 @login_required
 @admin_login_required
 def create_category():
@@ -143,104 +188,94 @@ def create_category():
         name = form.name.data # get inputted name
         category = Category(name=name) # stage new category name into the database
         db.session.add(category) # add staged changes
-        db.session.commit() # commit staged changes
+        try:
+            db.session.commit() # commit staged changes
+        except IntegrityError: # created by someone else since the form checked, the unique name_key index has the final say
+            db.session.rollback()
+            flash(f'Category {name} exists already.', 'warning')
+            return render_template('category create.html', page_name='Create a category', form=form)
         flash(f'Category {str(name)} created successfully!', 'success') # show success flash message if category is successfully created
-        return redirect(url_for('index'))
+        return redirect(url_for('catalog.index'))
     if form.errors:
         flash(form.errors) # flash error if there is a problem
 
     return render_template('category create.html', page_name='Create a category', form=form)
 
 # delete product by id
-@app.route('/product/<int:id>/delete', methods=['POST'])
+@admin_pages.route('/product/<int:id>/delete', methods=['POST'])
 @login_required
 @admin_login_required
 def delete_product(id):
     product = Product.query.get_or_404(id) # show product or send back a 404 error
     
-    # delete the image file if it exists
-    if product.image_path:
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], product.image_path)
-        if os.path.exists(image_path):
-            os.remove(image_path)
-    
-    # delete the product from database
+    # delete the product from database, with the cart lines pointing at it (by ix_cart_item_product_id)
+    db.session.execute(db.delete(CartItem).where(CartItem.product_id == product.id))
     db.session.delete(product)
     db.session.commit()
+
+    # delete the image and its variants unless another product uploaded the same file
+    if product.image_path and not Product.query.filter_by(image_path=product.image_path).first():
+        image_pipeline.remove(product.image_path)
     
     flash(f'Product {product.name} has been deleted.', 'success')
-    return redirect(url_for('products'))
+    return redirect(url_for('catalog.products'))
 
 # delete category by id
-@app.route('/category/<int:id>/delete', methods=['POST'])
+@admin_pages.route('/category/<int:id>/delete', methods=['POST'])
 @login_required
 @admin_login_required
 def delete_category(id):
     category = Category.query.get_or_404(id)
     
-    # Check if category has products
-    product_count = category.products.count()
+    # Check if category has products, the maintained counter instead of a COUNT over its products
+    product_count = category.product_count
     if product_count > 0:
         flash(f'Cannot delete category "{category.name}" because it has {product_count} product(s) associated with it. Please reassign or delete the products first.', 'danger')
-        return redirect(url_for('categories_list_admin'))
+        return redirect(url_for('admin.categories_list_admin'))
     
     category_name = category.name
     db.session.delete(category) # delete category
     db.session.commit() # commit changes
     
     flash(f'Category {category_name} has been deleted successfully.', 'success')
-    return redirect(url_for('categories_list_admin'))
+    return redirect(url_for('admin.categories_list_admin'))
 
-@app.route('/cart')
+@cart_pages.route('/cart')
 @login_required
 def view_cart():
     cart = Cart.query.filter_by(user_id=current_user.id).first()
-    # create a new cart if it is a new user
-    if not cart:
-        cart = Cart(user_id=current_user.id)
-        db.session.add(cart)
-    cart_items = cart.get_items()
-    return render_template('cart view.html', cart_items=cart_items)
-
-@app.route('/cart/purchase/<int:id>', methods=['POST'])
+    # a new user has no cart yet, it is made on the first add to cart rather than for every look at the page
+    cart_items, total = cart.summary() if cart else ([], cents_to_decimal(0)) # lines, subtotals and total from one query
+    return render_template('cart view.html', cart_items=cart_items, total=total)
+
+@cart_pages.route('/cart/purchase/<int:id>', methods=['POST'])
 @login_required
 def purchase(id):
     product = Product.query.get_or_404(id) # obtain the product
-    cart = Cart.query.filter_by(user_id=current_user.id).first()
-    # create a cart if it is a new user
-    if not cart:
-        cart = Cart(user_id=current_user.id)
-        db.session.add(cart)
-        db.session.commit()
-        
+    cart = Cart.for_user(current_user.id) # creates the cart for a new user, committed together with the item
     cart.add_item(product, quantity=1)
     db.session.commit()
     flash(f'Successfully added {product.name} into cart.', 'success')
-    return redirect(url_for('view_cart'))
+    return redirect(url_for('cart.view_cart'))
 
-@app.route('/cart/remove/<int:id>', methods=['POST'])
+@cart_pages.route('/cart/remove/<int:id>', methods=['POST'])
 @login_required
 def delete_cart_item(id):
     product = Product.query.get_or_404(id) # obtain the product
     cart = Cart.query.filter_by(user_id=current_user.id).first()
-    # create a cart if it is a new user
-    if not cart:
-        cart = Cart(user_id=current_user.id)
-        db.session.add(cart)
+    if cart: # nothing to remove if the user never had a cart
+        cart.remove_item(product, quantity=1)
         db.session.commit()
-        
-    cart.remove_item(product, quantity=1)
-    db.session.commit()
     flash(f'Successfully removed {product.name} from cart.', 'success')
-    return redirect(url_for('view_cart'))
+    return redirect(url_for('cart.view_cart'))
 
 
 # register new users
-@app.route('/register', methods=['GET', 'POST'])
+@auth_pages.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
         flash('You are already logged in', 'info')
-        return redirect(url_for('index'))
+        return redirect(url_for('catalog.index'))
     
     form = RegistrationForm()
 
@@ -248,16 +283,16 @@ def register():
         username = request.form.get('username')
         password = request.form.get('password')
         admin = False
-        existing_username = User.query.filter(User.username.like('%' + username + '%')).first()
-        if existing_username:
-            flash('Username already taken. Try another one.', 'warning')
-            return render_template('register.html', page_name='Register', form=form)
-        
         user = User(username, password, admin) # stage changes
         db.session.add(user) # add staged changes into session
-        db.session.commit() # commit session changes
+        try:
+            db.session.commit() # commit session changes
+        except IntegrityError: # no lookup first, the unique username indexes reject a taken name in the same statement
+            db.session.rollback()
+            flash('Username already taken. Try another one.', 'warning')
+            return render_template('register.html', page_name='Register', form=form)
         flash('Thank you for signing up as a user! Please try and log in now.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
     
     if form.errors:
         flash(form.errors)
@@ -265,7 +300,7 @@ def register():
     return render_template('register.html', page_name='Register', form=form)
 
 # log in user
-@app.route('/login', methods=['GET', 'POST'])
+@auth_pages.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
 
@@ -277,6 +312,8 @@ def login():
         if not (existing_user and existing_user.check_password(password)):
             flash('Invalid username or password. Please try again', 'danger')
             return render_template('login.html', page_name='Log In', form=form)
+        if existing_user.rehash_password(password): # the hash settings changed since this password was stored
+            db.session.commit()
         
         # check if checkbox is ticked
         if remember_me is None:
@@ -286,7 +323,7 @@ def login():
 
         login_user(existing_user, remember=remember_me)
         flash(f'You have successfully logged in as {username}!', 'success') 
-        return redirect(url_for('index'))
+        return redirect(url_for('catalog.index'))
     
     if form.errors:
         flash(form.errors)
@@ -294,29 +331,66 @@ def login():
     return render_template('login.html', page_name='Log In', form=form)
 
 # log out user
-@app.route('/logout')
+@auth_pages.route('/logout')
 @login_required
 def logout():
     logout_user()    
-    return redirect(url_for('index'))
+    return redirect(url_for('catalog.index'))
 
 
 
 # ----- ADMIN PANEL SECTION -----
-@app.route('/admin')
+@admin_pages.route('/admin')
 @login_required
 @admin_login_required
 def home_admin():
     return render_template('admin.html')
 
-@app.route('/admin/create-user', methods=['GET', 'POST'])
+# catalog cache counters, used to size CATALOG_CACHE_SIZE and CATALOG_CACHE_TTL
+@admin_pages.route('/admin/cache')
+@login_required
+@admin_login_required
+def cache_stats_admin():
+    return jsonify(catalog_cache.stats())
+
+# user list, keyset paginated and filtered by the query string (sort, direction, q, role, after), see app.accounts
+@admin_pages.route('/admin/users')
 @login_required
 @admin_login_required
 def users_list_admin():
-    users = User.query.all()
-    return render_template('users-list-admin.html', users=users)
+    options = listing_options(request.args)
+    listing = user_listing(request.args.get('per_page', 50, type=int), after=request.args.get('after'), **options)
+    return render_template('users-list-admin.html', listing=listing, options=options, list_args=listing_args(options))
+
+# the same list as CSV, streamed in batches so memory doesn't grow with the number of users
+@admin_pages.route('/admin/users.csv')
+@login_required
+@admin_login_required
+def users_export_admin():
+    response = Response(stream_with_context(users_csv(**listing_options(request.args))), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename=users.csv'
+    return response
+
+# promote, demote or delete the ticked users or every user matching the filter, in one transaction
+@admin_pages.route('/admin/users/bulk', methods=['POST'])
+@login_required
+@admin_login_required
+def users_bulk_admin():
+    options = listing_options(request.form)
+    action = request.form.get('action')
+    user_ids = None if request.form.get('scope') == 'matching' else request.form.getlist('ids', type=int)
+    if action not in BULK_ACTIONS:
+        flash('Pick an action.', 'warning')
+    elif user_ids == []:
+        flash('No users selected.', 'warning')
+    else:
+        changed = bulk_user_action(action, current_user.id, user_ids, options['query'], options['role'])
+        db.session.commit()
+        done = {'promote': 'made admin', 'demote': 'no longer admin', 'delete': 'deleted'}[action]
+        flash(f'{changed} user(s) {done}.', 'success')
+    return redirect(url_for('admin.users_list_admin', **listing_args(options)))
 
-@app.route('/admin/create-user')
+@admin_pages.route('/admin/create-user', methods=['GET', 'POST'])
 @login_required
 @admin_login_required
 def user_create_admin():    
@@ -326,23 +400,23 @@ def user_create_admin():
         username = form.username.data
         password = form.password.data
         admin = form.admin.data
-        existing_username = User.query.filter_by(username=username).first()
-        if existing_username:
-            flash('Username already taken. Try another one.', 'warning')
-            return render_template('user-create-admin.html', page_name='Register as admin', form=form)
-        
         user = User(username, password, admin) # stage changes
         db.session.add(user) # add staged changes into session
-        db.session.commit() # commit session changes
+        try:
+            db.session.commit() # commit session changes
+        except IntegrityError:
+            db.session.rollback()
+            flash('Username already taken. Try another one.', 'warning')
+            return render_template('user-create-admin.html', page_name='Register as admin', form=form)
         flash('New user created.', 'success')
-        return redirect(url_for('users_list_admin'))
+        return redirect(url_for('admin.users_list_admin'))
     
     if form.errors:
         flash(form.errors)
 
     return render_template('user-create-admin.html', page_name='Register as admin', form=form)
 
-@app.route('/admin/update-user/<id>', methods=['GET', 'POST'])
+@admin_pages.route('/admin/update-user/<id>', methods=['GET', 'POST'])
 @login_required
 @admin_login_required
 def user_update_admin(id):
@@ -355,24 +429,33 @@ def user_update_admin(id):
     if form.validate_on_submit():
         user.username = form.username.data
         user.admin = form.admin.data
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Username already taken. Try another one.', 'warning')
+            return render_template('user-update-admin.html', form=form, user=user)
         flash('User updated successfully.', 'success')
-        return redirect(url_for('users_list_admin'))
+        return redirect(url_for('admin.users_list_admin'))
     
     if form.errors:
         flash(form.errors, 'danger')
         
     return render_template('user-update-admin.html', form=form, user=user)
 
-@app.route('/admin/delete-user/<id>', methods=['GET', 'POST'])
+@admin_pages.route('/admin/delete-user/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_login_required
 def user_delete_admin(id):
-    user = User.query.get(id)
-    db.session.delete(user)
+    if id == current_user.id:
+        flash('You cannot delete your own account.', 'warning')
+        return redirect(url_for('admin.users_list_admin'))
+    # the bulk delete with one id, it removes the user's cart and cart items with them
+    if not bulk_user_action('delete', current_user.id, [id]):
+        abort(404)
     db.session.commit()
     flash('User deleted.', 'info')
-    return redirect(url_for('users_list_admin'))
+    return redirect(url_for('admin.users_list_admin'))
 
 '''
 Create admin with flask shell
@@ -0,0 +1,121 @@
+import re
+from sqlalchemy import event
+from app import db
+from app.models import Product
+from app.catalog import products_with_category
+
+# full text product search through an SQLite FTS5 index over Product.name and Product.description
+# product_search is an external content table: it only stores the index and reads the text from the product
+# table, triggers keep it in step with every insert, update and delete whichever code path writes the product.
+# batch migrations that rebuild the product table drop its triggers, run create_search_index() again after one.
+# other databases have no FTS5, search falls back to a LIKE on the name there
+
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(name, description, content='product', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')", # prefix indexes make 2 and 3 letter typeahead prefixes cheap
+    'CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN'
+    ' INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END',
+    'CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN'
+    " INSERT INTO product_search(product_search, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    'CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, description ON product BEGIN'
+    " INSERT INTO product_search(product_search, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);"
+    ' INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END'
+]
+DROP_DDL = [
+    'DROP TRIGGER IF EXISTS product_search_update',
+    'DROP TRIGGER IF EXISTS product_search_delete',
+    'DROP TRIGGER IF EXISTS product_search_insert',
+    'DROP TABLE IF EXISTS product_search'
+]
+NAME_WEIGHT, DESCRIPTION_WEIGHT = 10.0, 1.0 # bm25 column weights, a hit in the name counts ten times a hit in the description
+
+def create_search_index(connection, rebuild=False):
+    for statement in SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if rebuild: # index rows that were already in the product table
+        connection.exec_driver_sql("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+
+def after_product_create(table, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_search_index(connection)
+
+def before_product_drop(table, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in DROP_DDL:
+            connection.exec_driver_sql(statement)
+
+event.listen(Product.__table__, 'after_create', after_product_create)
+event.listen(Product.__table__, 'before_drop', before_product_drop)
+
+
+def match_expression(text):
+    # every word has to match, the last one as a prefix so results show up while the user is still typing.
+    # words are quoted so FTS5 syntax in the input (AND, NEAR, column filters, quotes) is searched for literally
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+# keyset pagination over (score, id), the cursor is the last row of the previous page.
+# repr() round trips a float exactly, so the next page starts right after it
+def encode_cursor(score, product_id):
+    return f'{score!r}:{product_id}'
+
+def decode_cursor(cursor):
+    try:
+        score, product_id = cursor.split(':')
+        return float(score), int(product_id)
+    except (AttributeError, ValueError):
+        return None
+
+class SearchPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+def search_products(text, per_page, category_id=None, after=None):
+    expression = match_expression(text)
+    if expression is None:
+        return SearchPage([], None)
+    after = decode_cursor(after) if after else None
+    if db.engine.dialect.name != 'sqlite':
+        rows = like_search(text, per_page, category_id, after)
+    else:
+        rows = fts_search(expression, per_page, category_id, after)
+
+    ids = [product_id for product_id, score in rows[:per_page]]
+    products = {product.id: product for product in products_with_category().filter(Product.id.in_(ids))} if ids else {}
+    items = [products[product_id] for product_id in ids if product_id in products] # IN (...) loses the ranking order
+    next_cursor = encode_cursor(rows[per_page - 1][1], rows[per_page - 1][0]) if len(rows) > per_page else None
+    return SearchPage(items, next_cursor)
+
+def fts_search(expression, per_page, category_id, after):
+    # bm25 is smaller for better matches, so ascending order puts the best first
+    category_filter = ' AND product.category_id = :category_id' if category_id else ''
+    cursor_filter = ' WHERE (score, id) > (:after_score, :after_id)' if after else ''
+    statement = db.text(
+        'SELECT id, score FROM ('
+        f' SELECT product.id AS id, bm25(product_search, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score'
+        ' FROM product_search JOIN product ON product.id = product_search.rowid'
+        f' WHERE product_search MATCH :expression{category_filter}'
+        f'){cursor_filter} ORDER BY score, id LIMIT :limit'
+    )
+    parameters = {'expression': expression, 'category_id': category_id, 'limit': per_page + 1}
+    if after:
+        parameters['after_score'], parameters['after_id'] = after
+    return db.session.execute(statement, parameters).all()
+
+def like_search(text, per_page, category_id, after):
+    # no ranking here, every match scores 0 and the pages follow the id
+    query = db.session.query(Product.id, db.literal(0.0)).filter(Product.name.ilike('%' + text.strip() + '%'))
+    if category_id:
+        query = query.filter(Product.category_id == category_id)
+    if after:
+        query = query.filter(Product.id > after[1])
+    return query.order_by(Product.id).limit(per_page + 1).all()
@@ -0,0 +1,102 @@
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import db
+
+# helpers for tests that want to pin down how many SQL statements a piece of code or a request runs,
+# so an N+1 query sneaking back into a route fails the test instead of slowing production down
+#
+#   assert_request_queries(client, 'GET', '/products', 3)
+#   assert_request_no_scans(client, 'GET', '/cart')
+#
+# don't wrap requests in your own app context while counting, the session would then live across requests
+# and its identity map hides queries (like load_user) that a real request runs
+
+@contextmanager
+def count_queries(app=None):
+    statements = [] # every statement sent to the database while the block runs
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    if app is None:
+        engine = db.engine # needs an active app context
+    else:
+        with app.app_context():
+            engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+@contextmanager
+def assert_max_queries(limit, app=None):
+    with count_queries(app) as statements:
+        yield statements
+    if len(statements) > limit:
+        raise AssertionError(f'expected at most {limit} queries, got {len(statements)}:\n' + '\n'.join(statements))
+
+def assert_request_queries(client, method, url, expected, **kwargs):
+    # runs one request through a test client, **kwargs go straight to client.open (data, follow_redirects, ...)
+    with count_queries(client.application) as statements:
+        response = client.open(url, method=method, **kwargs)
+    if len(statements) != expected:
+        raise AssertionError(f'{method} {url} ran {len(statements)} queries, expected {expected}:\n' + '\n'.join(statements))
+    return response
+
+# query plan checks (SQLite only): every statement a request runs is replayed through EXPLAIN QUERY PLAN
+# and a full table SCAN fails the test, so a dropped index or a query that can't use one shows up here.
+# a virtual table scan is a full text index lookup. SCAN ... USING (COVERING) INDEX walks a whole index in order,
+# which only passes when the statement has a LIMIT (the keyset paginated listings stop after a page); without one
+# it reads every row just like a table scan
+SCAN_LINE = re.compile(r'^SCAN (?!CONSTANT ROW)(\w+)\b(?! VIRTUAL TABLE)(?P<index> USING (?:COVERING )?INDEX \w+)?')
+LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+
+@contextmanager
+def capture_statements(app=None):
+    statements = [] # (statement, parameters) pairs, in the order they were sent
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    if app is None:
+        engine = db.engine
+    else:
+        with app.app_context():
+            engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def table_scans(statements, app=None, allow=()):
+    # allow lists the scans a page is expected to run, either a table name ('category' for a page that lists every
+    # category) or one exact scan ('product USING COVERING INDEX ix_product_listing' for a COUNT over that index)
+    scans = []
+    def explain(connection):
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+                match = SCAN_LINE.match(row[-1])
+                if not match or (match.group('index') and LIMIT.search(statement)):
+                    continue
+                if match.group(1) not in allow and match.group(0)[len('SCAN '):] not in allow:
+                    scans.append(f'{row[-1]}\n    {statement}')
+
+    if app is None:
+        with db.engine.connect() as connection:
+            explain(connection)
+    else:
+        with app.app_context(), db.engine.connect() as connection:
+            explain(connection)
+    return scans
+
+def assert_request_no_scans(client, method, url, allow=(), **kwargs):
+    with capture_statements(client.application) as statements:
+        response = client.open(url, method=method, **kwargs)
+    scans = table_scans(statements, client.application, allow)
+    if scans:
+        raise AssertionError(f'{method} {url} scanned a whole table:\n' + '\n'.join(scans))
+    return response
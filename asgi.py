@@ -0,0 +1,4 @@
+from app import create_app
+from app.asgi import make_asgi_app
+
+asgi_app = make_asgi_app(create_app()) # ASGI entry point: uvicorn asgi:asgi_app
@@ -0,0 +1,94 @@
+'''
+Concurrency stress check for cart mutations.
+
+    python -m benchmarks.cart_concurrency
+    python -m benchmarks.cart_concurrency --threads 16 --clicks 50
+
+Many threads click "add to cart" on the same product of the same cart at once, each click in its own
+app context, session and commit like a real request. Cart.add_item upserts, so the final quantity has to be
+exactly threads * clicks. The old SELECT then python-side increment is run as well for comparison, it
+loses increments as soon as two clicks overlap. Exits with status 1 if the upsert count is off.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from app import db
+from app.models import Product, Category, User, Cart, CartItem
+from benchmarks.common import make_app
+
+def setup(path):
+    bench_app = make_app(path)
+    with bench_app.app_context():
+        user = User('bench', 'bench', False)
+        category = Category('Bench')
+        db.session.add_all([user, category])
+        db.session.flush()
+        product = Product('Bench product', 1.0, category, 'bench.png', 'bench')
+        cart = Cart(user.id)
+        db.session.add_all([product, cart])
+        db.session.commit()
+        return bench_app, cart.id, product.id
+
+def legacy_add_item(cart_id, product_id):
+    # what Cart.add_item used to do: read the row, add in python, write the result back
+    cart_item = CartItem.query.filter_by(cart_id=cart_id, product_id=product_id).first()
+    if cart_item:
+        cart_item.quantity += 1
+    else:
+        db.session.add(CartItem(cart_id, product_id, 1))
+
+def upsert_add_item(cart_id, product_id):
+    db.session.get(Cart, cart_id).add_item(product_id, quantity=1)
+
+def run(add_item, threads, clicks):
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app, cart_id, product_id = setup(os.path.join(tmp, 'bench.db'))
+        start_line = threading.Barrier(threads)
+        errors = []
+
+        def worker():
+            start_line.wait() # line every thread up so the clicks really overlap
+            for _ in range(clicks):
+                with bench_app.app_context():
+                    try:
+                        add_item(cart_id, product_id)
+                        db.session.commit()
+                    except Exception as error:
+                        db.session.rollback()
+                        errors.append(error)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        with bench_app.app_context():
+            quantity = db.session.query(db.func.sum(CartItem.quantity)).filter_by(cart_id=cart_id).scalar() or 0
+            rows = CartItem.query.filter_by(cart_id=cart_id).count()
+            db.engine.dispose()
+    return quantity, rows, len(errors), elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clicks', type=int, default=25)
+    args = parser.parse_args()
+    expected = args.threads * args.clicks
+
+    failed = False
+    for name, add_item in [('legacy', legacy_add_item), ('upsert', upsert_add_item)]:
+        quantity, rows, errors, elapsed = run(add_item, args.threads, args.clicks)
+        print(f'{name:>7}: quantity {quantity}/{expected} in {rows} row(s), {errors} failed commit(s), '
+              f'{expected / elapsed:.0f} clicks/s')
+        if name == 'upsert' and (quantity != expected or rows != 1 or errors):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Rows and file space reclaimed by the cart maintenance run (app/maintenance.py), and what it costs.
+
+    python -m benchmarks.cart_maintenance
+    python -m benchmarks.cart_maintenance --users 200000 --carts 200000 --abandoned 0.7 --deleted-products 0.05
+
+Seeds a throwaway SQLite file with benchmarks.datagen, then ages it: --abandoned of the carts were last touched
+two months ago and --deleted-products of the products are deleted without their cart lines, the way
+delete_product used to. Reports the cart and cart item rows, the file size and the time of the cart page query
+for --lookups random users before and after one run_maintenance() with --batch sized batches, and the report
+of the run itself (rows purged, pages handed back and seconds per task).
+'''
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from app import db
+from app.maintenance import run_maintenance, format_report
+from app.models import Product, Cart, CartItem, utcnow
+from benchmarks.common import make_app
+from benchmarks.datagen import generate, add_volume_arguments, volumes_from
+
+def age(volumes, abandoned, deleted_products, seed):
+    rng = random.Random(seed)
+    carts = min(volumes['carts'], volumes['users'])
+    old = utcnow() - timedelta(days=60)
+    stale = rng.sample(range(1, carts + 1), int(carts * abandoned))
+    for start in range(0, len(stale), 10000):
+        db.session.execute(db.update(Cart).where(Cart.id.in_(stale[start:start + 10000])).values(updated_at=old))
+    gone = rng.sample(range(1, volumes['products'] + 1), int(volumes['products'] * deleted_products))
+    for start in range(0, len(gone), 10000):
+        db.session.execute(db.delete(Product).where(Product.id.in_(gone[start:start + 10000])))
+    db.session.commit()
+
+def state(path, users, lookups, seed):
+    # row counts, file size and cart page query times for random users
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(lookups):
+        start = time.perf_counter()
+        cart = Cart.query.filter_by(user_id=rng.randint(1, users)).first()
+        if cart:
+            cart.summary()
+        latencies.append(time.perf_counter() - start)
+        db.session.rollback()
+    with db.engine.connect() as connection: # WAL mode: the file only shrinks once the log is checkpointed
+        connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    return {
+        'carts': db.session.scalar(db.select(db.func.count(Cart.id))),
+        'items': db.session.scalar(db.select(db.func.count(CartItem.id))),
+        'megabytes': os.path.getsize(path) / 1e6,
+        'p50_ms': statistics.median(latencies) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_volume_arguments(parser)
+    parser.set_defaults(users=50000, carts=50000)
+    parser.add_argument('--abandoned', type=float, default=0.6, help='Share of carts last touched 60 days ago.')
+    parser.add_argument('--deleted-products', type=float, default=0.05, help='Share of products deleted without their cart lines.')
+    parser.add_argument('--batch', type=int, default=1000, help='CART_PURGE_BATCH')
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        bench_app = make_app(path, CART_PURGE_BATCH=args.batch, MAINTENANCE_MAX_SECONDS=3600, CART_STALE_DAYS=30,
+                             EMPTY_CART_HOURS=24, VACUUM_PAGES=10 ** 9)
+        with bench_app.app_context():
+            volumes = generate(volumes_from(args), args.seed)
+            age(volumes, args.abandoned, args.deleted_products, args.seed)
+            before = state(path, volumes['users'], args.lookups, args.seed)
+            report = run_maintenance()
+            after = state(path, volumes['users'], args.lookups, args.seed)
+            db.engine.dispose()
+
+    print(f'{"":<8} {"carts":>10} {"items":>10} {"file MB":>9} {"cart p50 ms":>12}')
+    for name, values in (('before', before), ('after', after)):
+        print(f'{name:<8} {values["carts"]:>10} {values["items"]:>10} {values["megabytes"]:>9.1f} {values["p50_ms"]:>12.3f}')
+    print()
+    for line in format_report(report):
+        print(line)
+
+if __name__ == '__main__':
+    main()
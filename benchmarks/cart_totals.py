@@ -0,0 +1,74 @@
+'''
+Query count and time for building the cart page data as carts grow.
+
+    python -m benchmarks.cart_totals
+    python -m benchmarks.cart_totals --sizes 10 100 1000 10000
+
+"summary" is Cart.summary(), what view_cart uses: lines, subtotals and the total from one query.
+"per item" walks Cart.items and lazy loads every product the way the cart page used to, for comparison.
+'''
+import argparse
+import os
+import tempfile
+import time
+from app import db
+from app.models import Product, Category, User, Cart, CartItem
+from app.testing import count_queries
+from benchmarks.common import make_app
+
+def seed(size):
+    category = Category('Bench')
+    user = User('bench', 'bench', False)
+    db.session.add_all([category, user])
+    db.session.flush()
+    db.session.execute(db.insert(Product), [
+        {'name': f'Product {i}', 'price_cents': 199 + i, 'image_path': f'{i}.png', 'description': 'bench', 'category_id': category.id}
+        for i in range(size)
+    ])
+    cart = Cart(user.id)
+    db.session.add(cart)
+    db.session.flush()
+    product_ids = [row[0] for row in db.session.query(Product.id)]
+    db.session.execute(db.insert(CartItem), [
+        {'cart_id': cart.id, 'product_id': product_id, 'quantity': 2} for product_id in product_ids
+    ])
+    db.session.commit()
+    return cart.id
+
+def per_item(cart_id):
+    cart = db.session.get(Cart, cart_id)
+    items = [{'product': item.product, 'quantity': item.quantity, 'subtotal': item.subtotal} for item in cart.items]
+    total = sum(item['subtotal'] for item in items)
+    return items, total
+
+def summary(cart_id):
+    return db.session.get(Cart, cart_id).summary()
+
+def measure(bench_app, func, cart_id):
+    with bench_app.app_context():
+        with count_queries() as statements:
+            start = time.perf_counter()
+            items, total = func(cart_id)
+            elapsed = (time.perf_counter() - start) * 1000
+    return len(statements), elapsed, total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    args = parser.parse_args()
+
+    print(f'{"items":>7} {"summary queries":>16} {"summary ms":>11} {"per item queries":>17} {"per item ms":>12}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench_app = make_app(os.path.join(tmp, 'bench.db'))
+            with bench_app.app_context():
+                cart_id = seed(size)
+            summary_queries, summary_ms, summary_total = measure(bench_app, summary, cart_id)
+            item_queries, item_ms, item_total = measure(bench_app, per_item, cart_id)
+            assert summary_total == item_total, (summary_total, item_total)
+            with bench_app.app_context():
+                db.engine.dispose()
+        print(f'{size:>7} {summary_queries:>16} {summary_ms:>11.2f} {item_queries:>17} {item_ms:>12.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+Bulk catalog import and export speed, the target is 100k products a minute.
+
+    python -m benchmarks.catalog_import
+    python -m benchmarks.catalog_import --products 100000 --batch-size 5000
+
+Writes a CSV of synthetic products over 50 categories, runs it through app.cli.import_catalog (what
+`flask catalog import` does) and exports it again with app.cli.export_catalog. No images, those depend on the
+disk more than on the import.
+'''
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+from app import db
+from app.cli import import_catalog, export_catalog
+from app.models import Product
+from benchmarks.common import make_app
+
+TARGET_PER_MINUTE = 100000
+
+def write_csv(path, products):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(('name', 'price', 'category', 'description'))
+        for i in range(products):
+            writer.writerow((f'Product {i}', f'{i % 500 + 1}.99', f'Category {i % 50}', 'A bench product ' * 5))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'products.csv')
+        write_csv(source, args.products)
+        bench_app = make_app(os.path.join(tmp, 'bench.db'), UPLOAD_FOLDER=os.path.join(tmp, 'images'))
+        with bench_app.app_context():
+            start = time.perf_counter()
+            with open(source, newline='', encoding='utf-8') as file:
+                imported, skipped, created = import_catalog(file, 'csv', tmp, batch_size=args.batch_size)
+            import_seconds = time.perf_counter() - start
+            assert db.session.query(db.func.count(Product.id)).scalar() == args.products
+
+            start = time.perf_counter()
+            exported = export_catalog(io.StringIO(), 'jsonl', batch_size=args.batch_size)
+            export_seconds = time.perf_counter() - start
+            db.engine.dispose()
+
+    import_rate = imported / import_seconds * 60
+    print(f'import: {imported} products, {created} categories in {import_seconds:.1f}s = {import_rate:,.0f} products/min '
+          f'({"meets" if import_rate >= TARGET_PER_MINUTE else "misses"} the {TARGET_PER_MINUTE:,}/min target)')
+    print(f'export: {exported} products in {export_seconds:.1f}s = {exported / export_seconds * 60:,.0f} products/min')
+
+if __name__ == '__main__':
+    main()
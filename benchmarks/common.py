@@ -0,0 +1,18 @@
+from flask import Flask
+from app import db
+from app.database import configure_sqlite, sqlite_pragmas
+from app import catalog, identity, search # noqa: F401, the session hooks and search index DDL create_app would load with the routes
+
+# every benchmark seeds and measures its own SQLite file in a temporary directory, products.db is never opened.
+# make_app is how most of them get at it
+
+def make_app(path, **config):
+    # a bare Flask app bound to the same models but to the benchmark's SQLite file
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    bench_app.config.update(config)
+    db.init_app(bench_app)
+    with bench_app.app_context():
+        configure_sqlite(db.engine, bench_app.config.get('SQLITE_PRAGMAS', sqlite_pragmas())) # same engine profile as the app
+        db.create_all()
+    return bench_app
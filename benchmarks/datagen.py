@@ -0,0 +1,112 @@
+'''
+Synthetic catalog, users and carts for benchmarks, the same data for the same --seed and volumes.
+
+    python -m benchmarks.datagen bench.db
+    python -m benchmarks.datagen bench.db --products 1000000 --users 100000 --carts 50000 --seed 7
+
+Writes into a new SQLite file (an existing one is refused) with batched executemany INSERTs, so a
+million products take seconds and memory stays flat. Product names and descriptions are built from
+a small vocabulary so search has something to match. Every user has the password "bench", the first
+one ("admin") is an admin. Other benchmarks call generate() inside their own app context.
+'''
+import argparse
+import os
+import random
+import time
+from app import db
+from app.catalog import recount_products
+from app.models import Product, Category, User, Cart, CartItem
+from app.passwords import hash_password
+
+VOLUMES = {
+    'categories': 20,
+    'products': 10000,
+    'users': 1000,
+    'carts': 500, # users with a cart, the first ones
+    'items': 5 # cart items per cart, on average
+}
+BATCH = 10000
+PASSWORD = 'bench'
+
+ADJECTIVES = ('red', 'blue', 'green', 'small', 'large', 'wooden', 'steel', 'vintage', 'modern', 'soft', 'heavy', 'portable')
+NOUNS = ('chair', 'table', 'lamp', 'mug', 'backpack', 'kettle', 'notebook', 'speaker', 'blanket', 'bottle', 'clock', 'jacket')
+WORDS = ('durable', 'handmade', 'everyday', 'gift', 'classic', 'compact', 'washable', 'recycled', 'premium', 'travel')
+
+def insert_batches(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            db.session.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+
+def generate(volumes=None, seed=0):
+    # fills the database of the current app context, which should be empty. Core inserts skip the model
+    # validators, so the normalized name columns are filled in here
+    volumes = dict(VOLUMES, **(volumes or {}))
+    rng = random.Random(seed)
+
+    insert_batches(Category, ({'name': f'Category {i}', 'name_key': f'category {i}'} for i in range(1, volumes['categories'] + 1)))
+
+    def products():
+        for i in range(1, volumes['products'] + 1):
+            yield {
+                'name': f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {i}',
+                'price_cents': rng.randint(99, 99999),
+                'image_path': f'product-{i}.png',
+                'description': ' '.join(rng.choices(WORDS, k=12)),
+                'category_id': rng.randint(1, volumes['categories']) if volumes['categories'] else None
+            }
+    insert_batches(Product, products())
+    recount_products() # the core inserts don't go through the session events that keep the counters
+
+    password_hash = hash_password(PASSWORD) # once, every user shares it
+    insert_batches(User, ({
+        'username': 'admin' if i == 1 else f'user{i}',
+        'username_key': 'admin' if i == 1 else f'user{i}',
+        'password_hash': password_hash,
+        'admin': i == 1
+    } for i in range(1, volumes['users'] + 1)))
+
+    carts = min(volumes['carts'], volumes['users'])
+    insert_batches(Cart, ({'user_id': i} for i in range(1, carts + 1))) # cart ids follow user ids
+
+    def items():
+        for cart_id in range(1, carts + 1):
+            count = min(rng.randint(0, volumes['items'] * 2), volumes['products'])
+            for product_id in rng.sample(range(1, volumes['products'] + 1), count):
+                yield {'cart_id': cart_id, 'product_id': product_id, 'quantity': rng.randint(1, 3)}
+    insert_batches(CartItem, items())
+
+    db.session.commit()
+    return volumes
+
+def add_volume_arguments(parser):
+    for name, default in VOLUMES.items():
+        parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--seed', type=int, default=0)
+
+def volumes_from(args):
+    return {name: getattr(args, name) for name in VOLUMES}
+
+def main():
+    from benchmarks.common import make_app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    add_volume_arguments(parser)
+    args = parser.parse_args()
+    if os.path.exists(args.path):
+        parser.error(f'{args.path} exists already')
+
+    start = time.perf_counter()
+    bench_app = make_app(os.path.abspath(args.path))
+    with bench_app.app_context():
+        volumes = generate(volumes_from(args), args.seed)
+        db.engine.dispose()
+    print(', '.join(f'{count} {name}' for name, count in volumes.items()) + f' in {time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+Compare the two ways of picking the 9 homepage products as the catalog grows.
+
+    python -m benchmarks.homepage_sampling
+    python -m benchmarks.homepage_sampling --sizes 1000 10000 100000 1000000 --runs 50
+
+"sql" is ORDER BY random() LIMIT 9, "pool" is what app.catalog.ProductIdPool does per request:
+an incremental id refresh (id > max_id) and one id IN (...) lookup.
+'''
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+SCHEMA = '''
+CREATE TABLE product (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    price FLOAT NOT NULL,
+    image_path VARCHAR(255) NOT NULL,
+    description VARCHAR(1000) NOT NULL,
+    category_id INTEGER
+)
+'''
+
+def seed(conn, size):
+    conn.execute(SCHEMA)
+    rows = ((f'Product {i}', i % 500 + 0.99, f'product-{i}.png', 'x' * 200, i % 50 + 1) for i in range(size))
+    conn.executemany('INSERT INTO product (name, price, image_path, description, category_id) VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+
+def time_runs(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+def bench(size, runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        seed(conn, size)
+
+        def sql_random():
+            conn.execute('SELECT * FROM product ORDER BY random() LIMIT 9').fetchall()
+
+        ids = [row[0] for row in conn.execute('SELECT id FROM product ORDER BY id')] # built once per worker
+        max_id = ids[-1]
+        def pool_random():
+            conn.execute('SELECT id FROM product WHERE id > ? ORDER BY id', (max_id,)).fetchall()
+            picked = random.sample(ids, 9)
+            conn.execute('SELECT * FROM product WHERE id IN (%s)' % ','.join('?' * len(picked)), picked).fetchall()
+
+        results = {'sql': time_runs(sql_random, runs), 'pool': time_runs(pool_random, runs)}
+        conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{"rows":>10} {"sql median ms":>14} {"sql max ms":>11} {"pool median ms":>15} {"pool max ms":>12}')
+    for size in args.sizes:
+        results = bench(size, args.runs)
+        sql_median, sql_max = results['sql']
+        pool_median, pool_max = results['pool']
+        print(f'{size:>10} {sql_median:>14.3f} {sql_max:>11.3f} {pool_median:>15.3f} {pool_max:>12.3f}')
+
+if __name__ == '__main__':
+    main()
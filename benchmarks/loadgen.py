@@ -0,0 +1,92 @@
+# a small HTTP/1.1 load generator for benchmarks that run the app in a real server process:
+# one asyncio client keeping many keep-alive connections busy, plus helpers to start and stop gunicorn or uvicorn
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def server_command(mode, port, workers, threads):
+    if mode == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app']
+    return [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port),
+            '--log-level', 'warning', '--no-access-log', 'asgi:asgi_app']
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for(port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+@contextmanager
+def server(mode, workers, threads, **env):
+    # yields the port of a server running the app from the repository root, env is added to its environment
+    port = free_port()
+    process = subprocess.Popen(server_command(mode, port, workers, threads), cwd=ROOT, env=dict(os.environ, **env))
+    try:
+        wait_for(port)
+        yield port
+    finally:
+        process.terminate()
+        process.wait()
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.lower().split(': ', 1) for line in lines[1:] if ': ' in line)
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection') == 'close'
+
+async def connection(port, deadline, requests, headers, latencies, failures):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            method, path = next(requests)
+            start = time.perf_counter()
+            writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\n{headers}\r\n'.encode('latin-1'))
+            status, closed = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400: # redirects after a POST are fine
+                failures[0] += 1
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            failures[0] += 1
+            closed = True
+        if closed and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+def load(port, connections, seconds, requests, headers=None):
+    # drives (method, path) pairs from the requests iterator over the connections for seconds,
+    # returns every request's latency in seconds and the number of failed ones
+    headers = ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+    latencies, failures = [], [0]
+    async def run():
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*[connection(port, deadline, requests, headers, latencies, failures) for _ in range(connections)])
+    asyncio.run(run())
+    return latencies, failures[0]
+
+def percentile(ordered, fraction):
+    # nearest rank on an already sorted list
+    if not ordered:
+        return 0.0
+    return ordered[max(int(round(len(ordered) * fraction)) - 1, 0)]
@@ -0,0 +1,65 @@
+'''
+Logins per second (and per core) for different password hash settings.
+
+    python -m benchmarks.login_throughput
+    python -m benchmarks.login_throughput --methods scrypt scrypt:16384:8:1 pbkdf2:sha256:600000 --threads 1 4 --seconds 5
+
+Each login is what the /login route does: look the user up by username and check the password with
+User.check_password, which goes through PASSWORD_HASH_WORKERS threads when that is set. --threads request
+threads log in at once, per core divides by the cores that could actually be busy and ms/login is how long
+each login took from the caller's side.
+'''
+import argparse
+import os
+import tempfile
+import threading
+import time
+from app import db
+from app.models import User
+from benchmarks.common import make_app
+
+def run(method, threads, seconds, hash_workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app = make_app(os.path.join(tmp, 'bench.db'), PASSWORD_HASH_METHOD=method, PASSWORD_HASH_WORKERS=hash_workers)
+        with bench_app.app_context():
+            db.session.add(User('bench', 'correct horse', False))
+            db.session.commit()
+
+        counts = [0] * threads
+        deadline = time.perf_counter() + seconds
+        def worker(index):
+            while time.perf_counter() < deadline:
+                with bench_app.app_context():
+                    user = User.query.filter_by(username='bench').first()
+                    assert user.check_password('correct horse')
+                counts[index] += 1
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        with bench_app.app_context():
+            db.engine.dispose()
+    return sum(counts) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', nargs='+', default=['scrypt', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000', 'pbkdf2:sha256:200000'])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--hash-workers', type=int, default=0, help='PASSWORD_HASH_WORKERS, 0 hashes on the calling thread')
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f'{"method":>24} {"threads":>8} {"logins/s":>9} {"per core":>9} {"ms/login":>9}')
+    for method in args.methods:
+        for threads in args.threads:
+            rate = run(method, threads, args.seconds, args.hash_workers)
+            busy = min(threads, args.hash_workers or threads, cores)
+            print(f'{method:>24} {threads:>8} {rate:>9.1f} {rate / busy:>9.1f} {1000 * threads / rate:>9.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+Registration throughput as the user table grows.
+
+    python -m benchmarks.registration
+    python -m benchmarks.registration --sizes 10000 100000 1000000 --registrations 200
+
+"like" is what register used to do: a LIKE '%name%' lookup, which reads every user, then the INSERT.
+"constraint" is the current register: just the INSERT, a taken name is rejected by the unique
+username_key index and caught as IntegrityError. Every fourth registration reuses an existing name
+(with different case) so both paths see rejections. Password hashing is left out, it costs the same
+either way and would hide the database work.
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import User
+from benchmarks.common import make_app
+
+BATCH = 50000
+
+def seed(size):
+    for start in range(0, size, BATCH): # batched so a million rows don't sit in memory at once
+        db.session.execute(db.insert(User), [
+            {'username': f'user{i}', 'username_key': f'user{i}', 'password_hash': 'bench', 'admin': False}
+            for i in range(start, min(start + BATCH, size))
+        ])
+    db.session.commit()
+
+def new_user(username):
+    user = db.inspect(User).class_manager.new_instance() # skip __init__, it hashes the password
+    db.session.add(user)
+    user.username = username # the validator fills username_key
+    user.password_hash = 'bench'
+    user.admin = False
+    return user
+
+def like_register(username):
+    if User.query.filter(User.username.like('%' + username + '%')).first():
+        return False
+    new_user(username)
+    db.session.commit()
+    return True
+
+def constraint_register(username):
+    new_user(username)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+def names(size, registrations, prefix):
+    for i in range(registrations):
+        if i % 4 == 3:
+            yield f'USER{random.randrange(size)}' # taken, only the case differs
+        else:
+            yield f'{prefix}{i}'
+
+def measure(bench_app, register, usernames):
+    accepted = 0
+    start = time.perf_counter()
+    for username in usernames:
+        with bench_app.app_context():
+            accepted += register(username)
+    return len(usernames) / (time.perf_counter() - start), accepted
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--registrations', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"users":>9} {"like reg/s":>11} {"constraint reg/s":>17} {"accepted":>9}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench_app = make_app(os.path.join(tmp, 'bench.db'))
+            with bench_app.app_context():
+                seed(size)
+            like_rate, _ = measure(bench_app, like_register, list(names(size, args.registrations, 'like')))
+            constraint_rate, constraint_accepted = measure(bench_app, constraint_register, list(names(size, args.registrations, 'new')))
+            with bench_app.app_context():
+                db.engine.dispose()
+        print(f'{size:>9} {like_rate:>11.0f} {constraint_rate:>17.0f} {constraint_accepted:>9}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''
+Throughput and tail latency of the WSGI and ASGI serving modes under many concurrent connections.
+
+    python -m benchmarks.serving_modes
+    python -m benchmarks.serving_modes --connections 1000 --seconds 20 --workers 4
+
+Seeds a throwaway SQLite file, then starts the app twice on it: "wsgi" is gunicorn main:app with --threads
+per worker, "asgi" is uvicorn asgi:asgi_app (app/asgi.py). Each one gets --connections keep-alive
+connections that request product pages and /products listing pages as fast as the server answers,
+all from one asyncio client. The page cache is off (PAGE_CACHE_TTL=0) so every request reads the database.
+Reports requests/s, p50/p99 latency and failed requests. Needs gunicorn, uvicorn, asgiref and aiosqlite,
+and an open file limit above --connections (ulimit -n).
+'''
+import argparse
+import os
+import random
+import statistics
+import tempfile
+from app import db
+from app.models import Product, Category
+from benchmarks.common import make_app
+from benchmarks.loadgen import server, load, percentile
+
+def seed(path, products):
+    bench_app = make_app(path)
+    with bench_app.app_context():
+        categories = [Category(f'Category {i}') for i in range(10)]
+        db.session.add_all(categories)
+        db.session.flush()
+        db.session.execute(db.insert(Product), [
+            {'name': f'Product {i}', 'price_cents': 199 + i % 5000, 'image_path': f'{i}.png', 'description': 'bench',
+             'category_id': categories[i % len(categories)].id}
+            for i in range(products)
+        ])
+        db.session.commit()
+        db.engine.dispose()
+
+def request_paths(products):
+    # product pages and listing pages from the first, middle and deep parts of the catalog
+    while True:
+        if random.random() < 0.5:
+            yield 'GET', f'/product/{random.randint(1, products)}'
+        else:
+            yield 'GET', f'/products/{random.randint(1, 20)}'
+
+def run(mode, path, args):
+    env = {'DATABASE_URL': 'sqlite:///' + path, 'PAGE_CACHE_TTL': '0', 'SECRET_KEY': 'bench'}
+    with server(mode, args.workers, args.threads, **env) as port:
+        load(port, min(args.connections, 50), 1, request_paths(args.products)) # warm up every worker's caches and pools
+        latencies, failures = load(port, args.connections, args.seconds, request_paths(args.products))
+    latencies.sort()
+    median = statistics.median(latencies) if latencies else 0
+    return len(latencies) / args.seconds, median * 1000, percentile(latencies, 0.99) * 1000, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker.')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--modes', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed(path, args.products)
+        print(f'{"mode":>5} {"requests/s":>11} {"p50 ms":>8} {"p99 ms":>8} {"failed":>7}')
+        for mode in args.modes:
+            throughput, median, p99, failures = run(mode, path, args)
+            print(f'{mode:>5} {throughput:>11.0f} {median:>8.1f} {p99:>8.1f} {failures:>7}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Multi-process read/write load against one SQLite file, the way several gunicorn workers share products.db.
+
+    python -m benchmarks.sqlite_load
+    python -m benchmarks.sqlite_load --processes 8 --seconds 10 --write-ratio 0.2
+
+Every process builds its own app and engine and loops for --seconds: mostly listing reads
+(a page of /products) with --write-ratio of add to cart writes, each in its own app context and commit.
+"rollback" is SQLite's defaults (rollback journal, no busy timeout), "wal" is the engine profile from
+app.database.sqlite_pragmas(). Reports reads/s, writes/s, failed operations ("database is locked")
+and the slowest read.
+'''
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from app import db
+from app.database import sqlite_pragmas
+from app.models import Product, Category, User, Cart
+from benchmarks.common import make_app
+
+PROFILES = {
+    'rollback': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 0},
+    'wal': sqlite_pragmas()
+}
+
+def seed(path, pragmas, products, carts):
+    bench_app = make_app(path, SQLITE_PRAGMAS=pragmas)
+    with bench_app.app_context():
+        category = Category('Bench')
+        db.session.add(category)
+        db.session.flush()
+        db.session.execute(db.insert(Product), [
+            {'name': f'Product {i}', 'price_cents': 199 + i, 'image_path': f'{i}.png', 'description': 'bench', 'category_id': category.id}
+            for i in range(products)
+        ])
+        users = [User(f'bench{i}', 'bench', False) for i in range(carts)]
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all([Cart(user.id) for user in users])
+        db.session.commit()
+        db.engine.dispose()
+
+def worker(path, pragmas, seconds, write_ratio, products, carts, results):
+    bench_app = make_app(path, SQLITE_PRAGMAS=pragmas)
+    reads = writes = errors = 0
+    slowest_read = 0.0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        with bench_app.app_context():
+            try:
+                if random.random() < write_ratio:
+                    cart = db.session.get(Cart, random.randint(1, carts))
+                    cart.add_item(random.randint(1, products))
+                    db.session.commit()
+                    writes += 1
+                else:
+                    start = time.perf_counter()
+                    Product.query.order_by(Product.category_id, Product.price_cents, Product.id) \
+                        .filter(Product.price_cents >= 199 + random.randrange(products)).limit(24).all()
+                    slowest_read = max(slowest_read, time.perf_counter() - start)
+                    reads += 1
+            except Exception:
+                db.session.rollback()
+                errors += 1
+    with bench_app.app_context():
+        db.engine.dispose()
+    results.put((reads, writes, errors, slowest_read))
+
+def run(pragmas, processes, seconds, write_ratio, products, carts):
+    context = multiprocessing.get_context('spawn') # fresh interpreters, no engine or connection inherited from the parent
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed(path, pragmas, products, carts)
+        results = context.Queue()
+        pool = [context.Process(target=worker, args=(path, pragmas, seconds, write_ratio, products, carts, results))
+                for _ in range(processes)]
+        for process in pool:
+            process.start()
+        totals = [results.get() for _ in pool]
+        for process in pool:
+            process.join()
+    reads = sum(result[0] for result in totals)
+    writes = sum(result[1] for result in totals)
+    errors = sum(result[2] for result in totals)
+    slowest_read = max(result[3] for result in totals)
+    return reads / seconds, writes / seconds, errors, slowest_read * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--carts', type=int, default=100)
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=['rollback', 'wal'])
+    args = parser.parse_args()
+
+    print(f'{"profile":>9} {"reads/s":>9} {"writes/s":>9} {"failed":>7} {"slowest read ms":>16}')
+    for name in args.profiles:
+        reads, writes, errors, slowest_read = run(PROFILES[name], args.processes, args.seconds, args.write_ratio,
+                                                   args.products, args.carts)
+        print(f'{name:>9} {reads:>9.0f} {writes:>9.0f} {errors:>7} {slowest_read:>16.2f}')
+
+if __name__ == '__main__':
+    main()
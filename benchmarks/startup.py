@@ -0,0 +1,132 @@
+'''
+Startup time and per worker memory of the app.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --workers 8
+
+Seeds a throwaway SQLite file (benchmarks.datagen, small volumes), then:
+cold start, --runs fresh interpreters that each import the app package, call create_app() and answer GET / through
+the test client, timing every step; and, for comparison, what the db.create_all() the app used to run at import
+costs on the same (already created) database.
+workers, gunicorn main:app with --workers, once as usual and once with --preload, which builds the app in the master
+and forks it into the workers: time until the first request is answered and RSS/PSS of the master and each worker
+from /proc (Linux only). PSS splits shared pages between the processes that share them, so it is the number that
+adds up to the real total. Needs gunicorn.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from app import db
+from benchmarks.common import make_app
+from benchmarks.datagen import generate
+from benchmarks.loadgen import ROOT, free_port, wait_for
+
+VOLUMES = {'categories': 10, 'products': 1000, 'users': 10, 'carts': 5, 'items': 3}
+
+# runs in a fresh interpreter, prints the step timings as JSON
+COLD_START = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get('/')
+first = time.perf_counter()
+with flask_app.app_context():
+    app.db.create_all()
+create_all = time.perf_counter() - first
+print(json.dumps({'status': response.status_code, 'import': imported - start, 'create_app': created - imported,
+                  'first_request': first - created, 'total': first - start, 'create_all': create_all}))
+'''
+
+def cold_start(env, runs):
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', COLD_START], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        timings.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    if any(timing['status'] >= 400 for timing in timings):
+        raise SystemExit('GET / failed in the cold start runs')
+    return {step: statistics.median(timing[step] for timing in timings)
+            for step in ('import', 'create_app', 'first_request', 'total', 'create_all')}
+
+def memory_kb(pid):
+    # rss and pss of one process in kB, smaps_rollup needs Linux 4.14
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                values[name.lower()] = int(rest.split()[0])
+    return values
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as file:
+        return [int(child) for child in file.read().split()]
+
+def workers(env, count, preload):
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(count), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    if preload:
+        command.append('--preload')
+    start = time.perf_counter()
+    process = subprocess.Popen(command + ['main:app'], cwd=ROOT, env=env)
+    try:
+        wait_for(port)
+        urllib.request.urlopen(f'http://127.0.0.1:{port}/').read()
+        first = time.perf_counter() - start
+        deadline = time.perf_counter() + 30
+        while len(children(process.pid)) < count and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        for _ in range(count * 4): # give every worker a request, so each one has loaded what a request needs
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/').read()
+        return {
+            'first_request': first,
+            'master': memory_kb(process.pid),
+            'workers': [memory_kb(pid) for pid in children(process.pid)]
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+def print_workers(name, result):
+    rows = result['workers']
+    print(f'{name:<10} {result["first_request"]:>10.2f} {result["master"]["rss"] / 1024:>11.1f} '
+          f'{statistics.mean(row["rss"] for row in rows) / 1024:>11.1f} {statistics.mean(row["pss"] for row in rows) / 1024:>11.1f} '
+          f'{(result["master"]["pss"] + sum(row["pss"] for row in rows)) / 1024:>10.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters for the cold start, the median is shown.')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers.')
+    parser.add_argument('--skip-workers', action='store_true', help='Only measure the cold start.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        bench_app = make_app(path)
+        with bench_app.app_context():
+            generate(VOLUMES)
+            db.engine.dispose()
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + path, SECRET_KEY='bench', PAGE_CACHE_TTL='0')
+
+        steps = cold_start(env, args.runs)
+        print(f'cold start, median of {args.runs} fresh interpreters')
+        for step in ('import', 'create_app', 'first_request', 'total'):
+            print(f'  {step:<14} {steps[step] * 1000:>8.1f} ms')
+        print(f'  {"create_all":<14} {steps["create_all"] * 1000:>8.1f} ms  (no longer run at startup)')
+
+        if args.skip_workers:
+            return
+        print(f'\n{"gunicorn":<10} {"first s":>10} {"master MB":>11} {"worker RSS":>11} {"worker PSS":>11} {"total PSS":>10}')
+        for name, preload in (('default', False), ('--preload', True)):
+            print_workers(name, workers(env, args.workers, preload))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+'''
+Per endpoint throughput and latency of the real routes on a generated database, as JSON.
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+    python -m benchmarks.suite --http wsgi --connections 200 --seconds 10
+    python -m benchmarks.suite --products 100000 --users 10000 --requests 500
+
+Seeds a throwaway SQLite file with benchmarks.datagen (same --seed and volumes, same data), then runs every
+endpoint in ENDPOINTS: by default --requests times one after another through the Flask test client, which also
+counts the SQL statements per request; with --http wsgi|asgi against gunicorn or uvicorn running the app on the
+same file, with --connections keep-alive connections for --seconds per endpoint (benchmarks.loadgen).
+Reports requests/s and p50/p95/p99 latency per endpoint, JSON goes to --output (or stdout) and a table to stderr.
+--compare reads an earlier result and exits with status 1 when an endpoint got slower than --tolerance allows
+(p95) or runs more statements than before, so run both on the same machine with the same arguments.
+The page cache is off unless --page-cache is given, so pages are rendered on every request.
+'''
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from app import create_app, db
+from app.testing import count_queries
+from benchmarks.datagen import generate, add_volume_arguments, volumes_from, NOUNS
+from benchmarks.loadgen import ROOT, server, load, percentile
+
+# the real app on a throwaway file, products.db is never opened. --http servers get the same file through DATABASE_URL
+WORKDIR = tempfile.mkdtemp(prefix='microstore-bench-')
+DATABASE_URL = 'sqlite:///' + os.path.join(WORKDIR, 'bench.db')
+app = create_app({'SQLALCHEMY_DATABASE_URI': DATABASE_URL})
+
+# method, path template, who is logged in. Placeholders get a random value per request, writes come last
+# so every read endpoint sees the generated data
+ENDPOINTS = (
+    ('GET', '/', None),
+    ('GET', '/products/{page}', None),
+    ('GET', '/product/{product}', None),
+    ('GET', '/search?q={word}', None),
+    ('GET', '/search.json?q={word}', None),
+    ('GET', '/api/v1/products?category={category}', None),
+    ('GET', '/api/v1/products/{product}', None),
+    ('GET', '/homepage', 'user'),
+    ('GET', '/cart', 'user'),
+    ('GET', '/api/v1/cart', 'user'),
+    ('GET', '/admin/categories', 'admin'),
+    ('GET', '/admin', 'admin'),
+    ('GET', '/admin/users', 'admin'),
+    ('GET', '/admin/users?sort=username&q=user{page}', 'admin'),
+    ('GET', '/admin/users.csv', 'admin'),
+    ('POST', '/cart/purchase/{product}', 'user')
+)
+USER_IDS = {'admin': 1, 'user': 2} # see benchmarks.datagen, user 2 has a cart
+
+def endpoint_name(method, template):
+    return f'{method} {template}'
+
+def paths(template, volumes, rng):
+    while True:
+        yield template.format(
+            page=rng.randint(1, 50),
+            product=rng.randint(1, volumes['products']),
+            category=rng.randint(1, max(volumes['categories'], 1)),
+            word=rng.choice(NOUNS)
+        )
+
+def summarize(latencies, errors, elapsed, queries=None):
+    latencies = sorted(latencies)
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)
+    }
+    if queries is not None:
+        summary['queries'] = queries
+    return summary
+
+def logged_in_client(viewer):
+    client = app.test_client()
+    if viewer:
+        with client.session_transaction() as session: # what flask-login stores on login, without the password check
+            session['_user_id'] = str(USER_IDS[viewer])
+            session['_fresh'] = True
+    return client
+
+def fetch(client, method, url):
+    # reads the whole body, a streamed response (the CSV export) only does its work while it is read
+    response = client.open(url, method=method)
+    response.get_data()
+    response.close()
+    return response.status_code
+
+def run_client(method, template, viewer, volumes, rng, args):
+    client = logged_in_client(viewer)
+    urls = paths(template, volumes, rng)
+    for url in itertools.islice(urls, args.warmup):
+        fetch(client, method, url)
+    planned = list(itertools.islice(urls, args.requests))
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for url in planned:
+        request_start = time.perf_counter()
+        status = fetch(client, method, url)
+        latencies.append(time.perf_counter() - request_start)
+        errors += status >= 400
+    elapsed = time.perf_counter() - start
+    with count_queries(app) as statements: # one more request, counted outside the timed loop
+        fetch(client, method, next(urls))
+    return summarize(latencies, errors, elapsed, len(statements))
+
+def session_cookie(viewer):
+    if not viewer:
+        return {}
+    value = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(USER_IDS[viewer]), '_fresh': True})
+    return {'Cookie': f'{app.config["SESSION_COOKIE_NAME"]}={value}'}
+
+def run_http(port, method, template, viewer, volumes, rng, args):
+    urls = ((method, url) for url in paths(template, volumes, rng))
+    headers = session_cookie(viewer)
+    load(port, min(args.connections, 20), 1, urls, headers) # warm up every worker
+    latencies, errors = load(port, args.connections, args.seconds, urls, headers)
+    return summarize(latencies, errors, args.seconds)
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--', 'app'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return commit, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def run(args):
+    volumes = volumes_from(args)
+    if volumes['users'] < 2 or volumes['carts'] < 2 or volumes['products'] < 1:
+        raise SystemExit('needs at least 2 users, 2 carts and 1 product')
+    app.config['SECRET_KEY'] = app.config['SECRET_KEY'] or 'bench'
+    if not args.page_cache:
+        app.config['PAGE_CACHE_TTL'] = 0
+    with app.app_context():
+        start = time.perf_counter()
+        db.create_all() # the app does no schema work of its own
+        generate(volumes, args.seed)
+        seconds = time.perf_counter() - start
+        db.session.remove()
+    print(f'seeded {", ".join(f"{count} {name}" for name, count in volumes.items())} in {seconds:.1f}s', file=sys.stderr)
+
+    commit, dirty = git_commit()
+    results = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'mode': args.http or 'client',
+            'seed': args.seed,
+            'volumes': volumes,
+            'page_cache': args.page_cache,
+            'requests': args.requests if not args.http else None,
+            'connections': args.connections if args.http else None,
+            'seconds': args.seconds if args.http else None
+        },
+        'endpoints': {}
+    }
+    if args.http:
+        env = {'DATABASE_URL': DATABASE_URL, 'SECRET_KEY': app.config['SECRET_KEY'], 'PAGE_CACHE_TTL': str(app.config['PAGE_CACHE_TTL'])}
+        with server(args.http, args.workers, args.threads, **env) as port:
+            for index, (method, template, viewer) in enumerate(ENDPOINTS):
+                rng = random.Random(args.seed * 1000 + index) # the same urls for every run
+                results['endpoints'][endpoint_name(method, template)] = run_http(port, method, template, viewer, volumes, rng, args)
+    else:
+        for index, (method, template, viewer) in enumerate(ENDPOINTS):
+            rng = random.Random(args.seed * 1000 + index)
+            results['endpoints'][endpoint_name(method, template)] = run_client(method, template, viewer, volumes, rng, args)
+    return results
+
+def print_table(results):
+    print(f'{"endpoint":<40} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"errors":>7}', file=sys.stderr)
+    for name, stats in results['endpoints'].items():
+        queries = stats.get('queries', '-')
+        print(f'{name:<40} {stats["throughput"]:>9.0f} {stats["p50_ms"]:>8.2f} {stats["p95_ms"]:>8.2f} '
+              f'{stats["p99_ms"]:>8.2f} {queries:>8} {stats["errors"]:>7}', file=sys.stderr)
+
+def compare(results, baseline, tolerance):
+    # returns one line per regression, p95 latency beyond the tolerance or more statements per request
+    setup = ('mode', 'seed', 'volumes', 'page_cache', 'requests', 'connections', 'seconds')
+    different = [key for key in setup if results['meta'].get(key) != baseline['meta'].get(key)]
+    if different:
+        raise SystemExit(f'not comparable, the runs differ in: {", ".join(different)}')
+    regressions = []
+    for name, stats in results['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+        if stats['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {old["p95_ms"]:.2f} -> {stats["p95_ms"]:.2f} ms')
+        if 'queries' in stats and 'queries' in old and stats['queries'] > old['queries']:
+            regressions.append(f'{name}: {old["queries"]} -> {stats["queries"]} queries per request')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_volume_arguments(parser)
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per endpoint (test client).')
+    parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per endpoint first (test client).')
+    parser.add_argument('--http', choices=['wsgi', 'asgi'], help='Load a real server instead of the test client.')
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=5, help='Per endpoint (--http).')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker.')
+    parser.add_argument('--page-cache', action='store_true', help='Keep PAGE_CACHE_TTL instead of turning the page cache off.')
+    parser.add_argument('--output', help='Write the JSON here instead of stdout.')
+    parser.add_argument('--compare', metavar='BASELINE', help='An earlier --output to check for regressions.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown for --compare, 0.2 is 20%%.')
+    args = parser.parse_args()
+
+    try:
+        results = run(args)
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f'regression {line}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions against {args.compare}', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
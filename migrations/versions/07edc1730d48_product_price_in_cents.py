@@ -0,0 +1,43 @@
+"""product price in cents
+
+Revision ID: 07edc1730d48
+Revises: f3abbaa46fa4
+Create Date: 2026-10-17 16:24:29.777319
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '07edc1730d48'
+down_revision = 'f3abbaa46fa4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # add the column as nullable, fill it from the old float prices, then tighten it and drop the float column
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('price_cents', sa.Integer(), nullable=True))
+
+    op.execute('UPDATE product SET price_cents = CAST(ROUND(price * 100) AS INTEGER)')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.alter_column('price_cents', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_index('ix_product_listing')
+        batch_op.create_index('ix_product_listing', ['category_id', 'price_cents', 'id'], unique=False)
+        batch_op.drop_column('price')
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('price', sa.FLOAT(), nullable=True))
+
+    op.execute('UPDATE product SET price = price_cents / 100.0')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.alter_column('price', existing_type=sa.FLOAT(), nullable=False)
+        batch_op.drop_index('ix_product_listing')
+        batch_op.create_index('ix_product_listing', ['category_id', 'price', 'id'], unique=False)
+        batch_op.drop_column('price_cents')
@@ -0,0 +1,51 @@
+"""product autoincrement
+
+Revision ID: 124e804ca595
+Revises: 5c895c66eac1
+Create Date: 2026-10-18 00:12:40.518930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '124e804ca595'
+down_revision = '5c895c66eac1'
+branch_labels = None
+depends_on = None
+
+
+# the search triggers of app.search.SEARCH_DDL, copied so the migration doesn't change if the app does.
+# rebuilding the product table drops them, the FTS5 table itself is untouched and the ids are copied over as they are
+SEARCH_TRIGGERS = [
+    'CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN'
+    ' INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END',
+    'CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN'
+    " INSERT INTO product_search(product_search, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    'CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, description ON product BEGIN'
+    " INSERT INTO product_search(product_search, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);"
+    ' INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END'
+]
+
+
+def rebuild_product(autoincrement):
+    with op.batch_alter_table('product', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+        pass
+    for statement in SEARCH_TRIGGERS:
+        op.execute(statement)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return # sequences on other databases never hand out an id twice
+    # without AUTOINCREMENT SQLite gives a new row max(rowid) + 1, the id of a just deleted newest product.
+    # the copy sets sqlite_sequence to the highest id in the table, ids deleted before the upgrade can still come back once
+    rebuild_product(True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_product(False)
@@ -0,0 +1,29 @@
+"""user admin not null
+
+Revision ID: 5c895c66eac1
+Revises: caeca9cfabd3
+Create Date: 2026-10-17 23:48:05.114276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c895c66eac1'
+down_revision = 'caeca9cfabd3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a NULL admin sorts before both roles and drops out of the admin list's (admin, id) cursor comparison
+    op.execute('UPDATE user SET admin = 0 WHERE admin IS NULL')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('admin', existing_type=sa.Boolean(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('admin', existing_type=sa.Boolean(), nullable=True)
@@ -0,0 +1,29 @@
+"""category product count
+
+Revision ID: 975fe35e7463
+Revises: b2766dee3e29
+Create Date: 2026-10-17 21:12:40.503718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '975fe35e7463'
+down_revision = 'b2766dee3e29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('category', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('product_count', sa.Integer(), server_default='0', nullable=False))
+
+    # one correlated COUNT per category, served by ix_product_listing (category_id first)
+    op.execute('UPDATE category SET product_count = (SELECT COUNT(*) FROM product WHERE product.category_id = category.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('category', schema=None) as batch_op:
+        batch_op.drop_column('product_count')
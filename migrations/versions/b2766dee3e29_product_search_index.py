@@ -0,0 +1,47 @@
+"""product search index
+
+Revision ID: b2766dee3e29
+Revises: 85dee7a28b63
+Create Date: 2026-10-17 16:47:05.603318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2766dee3e29'
+down_revision = '85dee7a28b63'
+branch_labels = None
+depends_on = None
+
+
+# same statements as app.search.SEARCH_DDL, copied so the migration doesn't change if the app does
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(name, description, content='product', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    'CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN'
+    ' INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END',
+    'CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN'
+    " INSERT INTO product_search(product_search, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    'CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, description ON product BEGIN'
+    " INSERT INTO product_search(product_search, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);"
+    ' INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END'
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return # FTS5 is SQLite only, other databases search with LIKE
+    for statement in SEARCH_DDL:
+        op.execute(statement)
+    op.execute("INSERT INTO product_search(product_search) VALUES ('rebuild')") # index the existing products
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP TRIGGER IF EXISTS product_search_update')
+    op.execute('DROP TRIGGER IF EXISTS product_search_delete')
+    op.execute('DROP TRIGGER IF EXISTS product_search_insert')
+    op.execute('DROP TABLE IF EXISTS product_search')
@@ -0,0 +1,34 @@
+"""cart updated at
+
+Revision ID: caeca9cfabd3
+Revises: f93a17c5d994
+Create Date: 2026-10-17 22:31:18.402157
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'caeca9cfabd3'
+down_revision = 'f93a17c5d994'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cart', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # existing carts start ageing from the upgrade, their last use isn't known
+    op.execute('UPDATE cart SET updated_at = CURRENT_TIMESTAMP')
+
+    with op.batch_alter_table('cart', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_cart_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cart', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cart_updated_at'))
+        batch_op.drop_column('updated_at')
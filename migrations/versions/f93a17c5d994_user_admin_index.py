@@ -0,0 +1,26 @@
+"""user admin index
+
+Revision ID: f93a17c5d994
+Revises: 975fe35e7463
+Create Date: 2026-10-17 21:48:05.771329
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f93a17c5d994'
+down_revision = '975fe35e7463'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_admin'), ['admin'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_admin'))
@@ -0,0 +1,54 @@
+import pytest
+from app import create_app, db
+from app.cache import catalog_cache
+from app.catalog import product_pool
+from app.identity import user_cache
+from benchmarks.datagen import generate
+
+# every test gets its own SQLite file filled by benchmarks.datagen: user 1 is the admin ("admin"), users 2.. are
+# customers ("user2", ...) and the first CARTS of them have a cart. Page caching is off so every request renders
+
+VOLUMES = {'categories': 5, 'products': 60, 'users': 6, 'carts': 3, 'items': 3}
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'images'),
+        'WTF_CSRF_ENABLED': False,
+        'PAGE_CACHE_TTL': 0
+    })
+    with app.app_context():
+        # the caches are module level and outlive an app, start every test without entries from the last one
+        catalog_cache.clear()
+        user_cache.clear()
+        product_pool.reset([])
+        product_pool.loaded = False
+        db.create_all()
+        generate(VOLUMES)
+        db.session.remove()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+def logged_in(app, user_id):
+    # a test client with user_id logged in, what flask-login keeps in the session without the password check
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def customer(app):
+    return logged_in(app, 2) # has a cart
+
+@pytest.fixture
+def admin(app):
+    return logged_in(app, 1)
@@ -0,0 +1,75 @@
+from collections import namedtuple
+import pytest
+from app import db
+from app.accounts import user_listing, encode_user_cursor
+from app.models import User, Cart, CartItem
+
+# the test data has user 1 "admin" (an admin) and the customers user2 .. user6, users 1 to 3 have a cart
+
+def walk(per_page, **options):
+    # every page of the admin user list, as lists of ids
+    pages, after = [], None
+    while True:
+        listing = user_listing(per_page, after=after, **options)
+        pages.append([row.id for row in listing.items])
+        if not listing.has_next:
+            return pages
+        after = listing.next_cursor
+
+@pytest.mark.parametrize('options, expected', [
+    ({}, [[1, 2], [3, 4], [5, 6]]),
+    ({'direction': 'desc'}, [[6, 5], [4, 3], [2, 1]]),
+    ({'sort': 'username', 'direction': 'desc'}, [[6, 5], [4, 3], [2, 1]]),
+    ({'sort': 'admin'}, [[2, 3], [4, 5], [6, 1]]),
+    ({'sort': 'admin', 'direction': 'desc'}, [[1, 6], [5, 4], [3, 2]]),
+    ({'role': 'customer'}, [[2, 3], [4, 5], [6]]),
+    ({'role': 'admin'}, [[1]]),
+    ({'query': 'USER4'}, [[4]]),
+    ({'query': 'user', 'sort': 'username'}, [[2, 3], [4, 5], [6]])
+])
+def test_listing_pages_every_sort_and_filter(app, options, expected):
+    with app.app_context():
+        assert walk(2, **options) == expected
+
+def test_admin_cursor_of_a_user_without_role(app):
+    row = namedtuple('Row', 'id admin')(7, None)
+    assert encode_user_cursor('admin', row) == '0:7'
+
+def test_user_list_page(admin, customer):
+    page = admin.get('/admin/users?role=customer&q=user&sort=username&direction=desc')
+    assert page.status_code == 200
+    assert b'user6' in page.data and b'>admin<' not in page.data
+    assert customer.get('/admin/users').status_code == 403
+
+def test_csv_export_follows_the_filter(admin, customer):
+    response = admin.get('/admin/users.csv?role=customer&direction=desc')
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).splitlines() == [
+        'id,username,admin', '6,user6,0', '5,user5,0', '4,user4,0', '3,user3,0', '2,user2,0'
+    ]
+    assert customer.get('/admin/users.csv').status_code == 403
+
+def admins(app):
+    with app.app_context():
+        return db.session.scalars(db.select(User.id).where(User.admin).order_by(User.id)).all()
+
+def test_bulk_promote_and_demote_picked_users(app, admin):
+    admin.post('/admin/users/bulk', data={'action': 'promote', 'ids': ['2', '3']})
+    assert admins(app) == [1, 2, 3]
+    # the acting admin is never changed
+    admin.post('/admin/users/bulk', data={'action': 'demote', 'ids': ['1', '2']})
+    assert admins(app) == [1, 3]
+
+def test_bulk_delete_matching_users_takes_their_carts(app, admin):
+    response = admin.post('/admin/users/bulk', data={'action': 'delete', 'scope': 'matching', 'role': 'customer'},
+                          follow_redirects=True)
+    assert b'5 user(s) deleted.' in response.data
+    with app.app_context():
+        assert db.session.scalars(db.select(User.id)).all() == [1]
+        assert db.session.scalars(db.select(Cart.user_id)).all() == [1]
+        assert db.session.scalar(db.select(db.func.count(CartItem.id)).where(CartItem.cart_id != 1)) == 0
+
+def test_bulk_without_a_selection_changes_nothing(app, admin):
+    response = admin.post('/admin/users/bulk', data={'action': 'promote'}, follow_redirects=True)
+    assert b'No users selected.' in response.data
+    assert admins(app) == [1]
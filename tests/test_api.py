@@ -0,0 +1,86 @@
+import pytest
+from app import db
+from app.models import Product, CartItem
+
+STORED = 'a' * 64 + '.png'
+
+def cart_lines(app, cart_id):
+    with app.app_context():
+        return dict(db.session.execute(db.select(CartItem.product_id, CartItem.quantity).where(CartItem.cart_id == cart_id)).all())
+
+@pytest.mark.parametrize('method, url', [
+    ('GET', '/api/v1/cart'),
+    ('PATCH', '/api/v1/cart'),
+    ('POST', '/api/v1/cart/items'),
+    ('DELETE', '/api/v1/cart/items/1'),
+    ('POST', '/api/v1/products'),
+    ('POST', '/api/v1/categories')
+])
+def test_anonymous_requests_get_401(client, method, url):
+    response = client.open(url, method=method, json={})
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'login required'}
+
+@pytest.mark.parametrize('url', ['/api/v1/products', '/api/v1/categories'])
+def test_customers_get_403_on_admin_endpoints(customer, url):
+    response = customer.post(url, json={'name': 'Nope'})
+    assert response.status_code == 403
+    assert response.get_json() == {'error': 'admin only'}
+
+def test_unknown_product_is_404(client, customer):
+    assert client.get('/api/v1/products/9999').status_code == 404
+    assert client.get('/api/v1/products/9999').get_json() == {'error': 'product not found'}
+    assert customer.post('/api/v1/cart/items', json={'product_id': 9999}).status_code == 404
+    response = customer.patch('/api/v1/cart', json={'items': [{'product_id': 1, 'quantity': 1}, {'product_id': 9998, 'quantity': 1}]})
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'unknown product(s): 9998'}
+
+def test_removing_a_product_not_in_the_cart_is_404(app, customer):
+    missing = min(set(range(1, 61)) - set(cart_lines(app, 2)))
+    response = customer.delete(f'/api/v1/cart/items/{missing}')
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'product is not in the cart'}
+
+@pytest.mark.parametrize('quantity, error', [
+    ('0', 'quantity must be at least 1'),
+    ('-3', 'quantity must be at least 1'),
+    ('two', 'quantity must be a whole number'),
+    ('2.5', 'quantity must be a whole number')
+])
+def test_removal_quantity_must_be_at_least_one(app, customer, quantity, error):
+    customer.post('/api/v1/cart/items', json={'product_id': 1, 'quantity': 2})
+    before = cart_lines(app, 2)
+    response = customer.delete(f'/api/v1/cart/items/1?quantity={quantity}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+    assert cart_lines(app, 2) == before
+
+def test_removal_takes_off_the_quantity(app, customer):
+    customer.post('/api/v1/cart/items', json={'product_id': 1, 'quantity': 3})
+    quantity = cart_lines(app, 2)[1]
+    assert customer.delete('/api/v1/cart/items/1?quantity=2').status_code == 200
+    assert cart_lines(app, 2)[1] == quantity - 2
+    customer.delete(f'/api/v1/cart/items/1?quantity={quantity}')
+    assert 1 not in cart_lines(app, 2)
+
+@pytest.mark.parametrize('image_path', [
+    '../../etc/passwd', '/etc/passwd', 'images/' + STORED, STORED.upper(), 'a' * 63 + '.png', STORED + '/..', 42
+])
+def test_image_path_must_be_a_stored_name(app, admin, image_path):
+    item = {'name': 'Lamp', 'price': '9.99', 'category_id': 1, 'image_path': image_path}
+    response = admin.post('/api/v1/products', json=[{'name': 'Fine', 'price': '1.00', 'category_id': 1}, item])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'item 1: image_path must be the name of a stored image'}
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Product.id)).where(Product.name.in_(['Fine', 'Lamp']))) == 0
+
+def test_create_products_with_stored_image_names(app, admin):
+    response = admin.post('/api/v1/products', json=[
+        {'name': 'Lamp', 'price': '9.99', 'category_id': 1, 'image_path': STORED},
+        {'name': 'Rug', 'price': '20.00', 'category_id': 2}
+    ])
+    assert response.status_code == 201
+    created = response.get_json()['products']
+    assert [product['name'] for product in created] == ['Lamp', 'Rug']
+    with app.app_context():
+        assert db.session.get(Product, created[0]['id']).image_path == STORED
@@ -0,0 +1,29 @@
+from flask import Flask
+from app.cache import CatalogCache, LRUCache
+
+def shared_caches():
+    app = Flask(__name__)
+    app.config['CATALOG_CACHE_BACKEND'] = LRUCache() # one instance, as a redis or memcached client would share a server
+    return app, CatalogCache('catalog'), CatalogCache('user')
+
+def test_clearing_one_namespace_keeps_the_other():
+    app, catalog, users = shared_caches()
+    with app.app_context():
+        catalog.set('product:1', {'name': 'Lamp'})
+        users.set('user:1', (1, 'admin', True))
+        users.clear()
+        assert users.get('user:1') is None
+        assert catalog.get('product:1') == {'name': 'Lamp'}
+        users.set('user:1', (1, 'admin', False))
+        catalog.clear()
+        assert catalog.get('product:1') is None
+        assert users.get('user:1') == (1, 'admin', False)
+
+def test_namespaces_dont_share_keys():
+    app, catalog, users = shared_caches()
+    with app.app_context():
+        catalog.set('1', 'product')
+        users.set('1', 'user')
+        assert (catalog.get('1'), users.get('1')) == ('product', 'user')
+        users.delete('1')
+        assert catalog.get('1') == 'product'
@@ -0,0 +1,38 @@
+import threading
+from app import db
+from app.models import Cart, CartItem
+
+THREADS, CLICKS = 8, 5
+
+def test_concurrent_adds_of_one_product_share_one_row(app):
+    # every click in its own app context, session and commit like a request. The first clicks race to insert the
+    # line, the losers hit uq_cart_item_cart_product and add to the stored quantity instead
+    with app.app_context():
+        cart_id = 2
+        in_cart = db.session.scalars(db.select(CartItem.product_id).where(CartItem.cart_id == cart_id)).all()
+        product_id = min(set(range(1, 61)) - set(in_cart))
+    start_line = threading.Barrier(THREADS)
+    errors = []
+
+    def click():
+        start_line.wait()
+        for _ in range(CLICKS):
+            with app.app_context():
+                try:
+                    db.session.get(Cart, cart_id).add_item(product_id)
+                    db.session.commit()
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    db.session.remove()
+
+    threads = [threading.Thread(target=click) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        rows = db.session.scalars(db.select(CartItem.quantity).where(CartItem.cart_id == cart_id, CartItem.product_id == product_id)).all()
+    assert rows == [THREADS * CLICKS]
@@ -0,0 +1,44 @@
+import io
+import click
+import pytest
+from app import db
+from app.cli import import_catalog
+from app.models import Category, Product
+
+CSV = '''name,price,category,description
+Lamp,12.50,Lighting,a lamp
+No category,3.00,,skipped
+Blank category,4.00,   ,skipped
+Chair,30.00,Furniture,a chair
+'''
+
+def test_rows_without_a_category_are_skipped(app):
+    with app.app_context():
+        before = db.session.scalar(db.select(db.func.count(Product.id)))
+        imported, skipped, created = import_catalog(io.StringIO(CSV), 'csv')
+        assert (imported, skipped, created) == (2, 2, 2)
+        assert db.session.scalar(db.select(db.func.count(Product.id))) == before + 2
+        assert db.session.scalar(db.select(db.func.count(Product.id)).where(Product.category_id.is_(None))) == 0
+
+def test_missing_category_stops_a_strict_import(app):
+    with app.app_context():
+        with pytest.raises(click.ClickException, match='row 2: needs a category'):
+            import_catalog(io.StringIO('{"name": "Lamp", "price": "1.00", "category": "Lighting"}\n{"name": "Mug", "price": "2.00"}\n'), 'jsonl', strict=True)
+
+def test_imported_products_render(app, client):
+    with app.app_context():
+        import_catalog(io.StringIO(CSV), 'csv')
+        product_id = db.session.scalar(db.select(Product.id).where(Product.name == 'Chair'))
+    assert client.get(f'/product/{product_id}').status_code == 200
+    assert client.get('/search?q=chair').status_code == 200
+
+def test_bad_rows_leave_no_new_category(app):
+    rows = [
+        '{"name": "Free lamp", "price": "0", "category": "Orphans"}',
+        '{"name": " ", "price": "5.00", "category": "Nameless"}',
+        '{"name": "Escape", "price": "5.00", "category": "Escapes", "image_path": "../secret.png"}'
+    ]
+    with app.app_context():
+        assert import_catalog(io.StringIO('\n'.join(rows) + '\n'), 'jsonl') == (0, 3, 0)
+        names = ['Orphans', 'Nameless', 'Escapes']
+        assert db.session.scalar(db.select(db.func.count(Category.id)).where(Category.name.in_(names))) == 0
@@ -0,0 +1,35 @@
+import pytest
+from app import db
+from app.catalog import recount_products
+from app.models import Product, Category
+
+def counts():
+    return dict(db.session.execute(db.select(Category.id, Category.product_count)).all())
+
+@pytest.mark.parametrize('move', ['category_id', 'category'])
+def test_moving_a_freshly_loaded_product(app, move):
+    with app.app_context():
+        product = db.session.scalars(db.select(Product).where(Product.category_id == 1).limit(1)).one()
+        before = counts()
+        db.session.commit() # expires the product, like a request that loads it after another one committed
+        if move == 'category_id':
+            product.category_id = 2
+        else:
+            product.category = db.session.get(Category, 2)
+        db.session.commit()
+        after = counts()
+        assert after[1] == before[1] - 1
+        assert after[2] == before[2] + 1
+        assert recount_products() == []
+
+def test_adding_and_deleting_products(app):
+    with app.app_context():
+        before = counts()
+        product = Product('Lamp', '9.99', db.session.get(Category, 3), '', 'a lamp')
+        db.session.add(product)
+        db.session.commit()
+        assert counts()[3] == before[3] + 1
+        db.session.delete(product)
+        db.session.commit()
+        assert counts() == before
+        assert recount_products() == []
@@ -0,0 +1,37 @@
+from datetime import timedelta
+from app import create_app, db, maintenance
+from app.maintenance import MaintenanceScheduler, run_maintenance
+from app.models import Cart, CartItem, Product, utcnow
+
+def test_purges_orphaned_items_and_stale_carts(app):
+    with app.app_context():
+        db.session.execute(db.update(Cart).where(Cart.id == 1).values(updated_at=utcnow() - timedelta(days=60)))
+        product_id = db.session.scalar(db.select(CartItem.product_id).where(CartItem.cart_id != 1).limit(1))
+        db.session.execute(db.delete(Product).where(Product.id == product_id)) # leaves its cart lines behind
+        db.session.commit()
+        orphans = db.session.scalar(db.select(db.func.count(CartItem.id)).where(CartItem.product_id == product_id, CartItem.cart_id != 1))
+        assert orphans >= 1
+
+        report = run_maintenance()
+        assert report['orphaned cart items']['items'] == orphans
+        assert report['abandoned carts']['carts'] == 1
+        assert report['abandoned carts']['finished'] is True
+        assert db.session.get(Cart, 1) is None
+        assert db.session.get(Cart, 2) is not None and db.session.get(Cart, 3) is not None
+        assert db.session.scalar(db.select(db.func.count(CartItem.id)).where(CartItem.cart_id == 1)) == 0
+        assert 'pages' in report['vacuum'] # the test database is made with auto_vacuum=INCREMENTAL
+
+def test_scheduler_starts_on_the_first_request(tmp_path, monkeypatch):
+    # not in create_app, so gunicorn --preload workers start their own thread after the fork
+    scheduler = MaintenanceScheduler()
+    monkeypatch.setattr(maintenance, 'maintenance_scheduler', scheduler)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'), 'SECRET_KEY': 'test',
+                      'MAINTENANCE_INTERVAL': 3600})
+    assert scheduler.thread is None
+    app.test_client().get('/')
+    assert scheduler.thread.is_alive()
+    thread = scheduler.thread
+    app.test_client().get('/')
+    assert scheduler.thread is thread
+    scheduler.stop()
+    thread.join(5)
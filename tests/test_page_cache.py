@@ -0,0 +1,55 @@
+import pytest
+from app import db
+from app.catalog import product_listing
+from app.models import Product
+from app.testing import assert_request_queries
+
+@pytest.fixture
+def app(app):
+    app.config['PAGE_CACHE_TTL'] = 60 # the shared fixture turns page caching off
+    return app
+
+def test_repeat_views_are_served_from_the_cache(client):
+    first = client.get('/product/1')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    again = assert_request_queries(client, 'GET', '/product/1', 0)
+    assert again.data == first.data and again.headers['ETag'] == first.headers['ETag']
+
+def test_unchanged_page_is_a_304(client):
+    etag = client.get('/products/1').headers['ETag']
+    response = client.get('/products/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert client.get('/products/2', headers={'If-None-Match': etag}).status_code == 200
+
+def test_logged_in_users_bypass_the_cache(client, customer):
+    client.get('/product/1')
+    response = customer.get('/product/1')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert b'user2' in response.data
+
+def test_pending_flash_bypasses_the_cache(client, app):
+    cached = client.get('/product/1').data
+    flashed = app.test_client()
+    with flashed.session_transaction() as session:
+        session['_flashes'] = [('success', 'Product saved.')]
+    response = flashed.get('/product/1')
+    assert b'Product saved.' in response.data and 'ETag' not in response.headers
+    # the page with the message is not stored either
+    assert client.get('/product/1').data == cached
+    assert b'Product saved.' not in flashed.get('/product/1').data
+
+def test_product_edit_invalidates_cached_pages(client, app):
+    with app.app_context():
+        product_id = product_listing(3).items[0].id # on /products/1, which shows 3 a page
+    page = client.get(f'/product/{product_id}').headers['ETag']
+    listing = client.get('/products/1').headers['ETag']
+    with app.app_context():
+        db.session.get(Product, product_id).name = 'Renamed lamp'
+        db.session.commit()
+    for url, etag in ((f'/product/{product_id}', page), ('/products/1', listing)):
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'Renamed lamp' in response.data
@@ -0,0 +1,68 @@
+import pytest
+from app import db
+from app.catalog import product_listing, cursor_for
+from app.models import Product
+
+PER_PAGE = 7
+
+def listing_order():
+    # every product id in listing order, NULL categories first like SQLite sorts them
+    return db.session.scalars(db.select(Product.id).order_by(
+        Product.category_id.is_not(None), Product.category_id, Product.price_cents, Product.id)).all()
+
+def walk_forward():
+    pages = [product_listing(PER_PAGE)]
+    while pages[-1].has_next:
+        pages.append(product_listing(PER_PAGE, after=pages[-1].next_cursor))
+    return pages
+
+def walk_back(last):
+    pages = [last]
+    while pages[-1].has_prev:
+        pages.append(product_listing(PER_PAGE, before=pages[-1].prev_cursor))
+    return pages[::-1]
+
+def ids(pages):
+    return [product.id for page in pages for product in page.items]
+
+def check_walks():
+    expected = listing_order()
+    forward = walk_forward()
+    assert ids(forward) == expected
+    assert all(len(page.items) == PER_PAGE for page in forward[:-1])
+    back = walk_back(forward[-1])
+    assert ids(back) == expected
+    assert [[product.id for product in page.items] for page in back] == [[product.id for product in page.items] for page in forward]
+
+def test_walk_forward_and_back(app):
+    with app.app_context():
+        check_walks()
+
+def test_price_ties_inside_a_category(app):
+    # a whole category at one price, so pages break between rows that only the id tells apart
+    with app.app_context():
+        db.session.execute(db.update(Product).where(Product.category_id == 2).values(price_cents=500))
+        db.session.commit()
+        check_walks()
+
+def test_products_without_a_category(app):
+    # a NULL never compares, the cursor of a product without a category has to be handled on its own
+    with app.app_context():
+        db.session.execute(db.update(Product).where(Product.id.in_(range(1, 60, 4))).values(category_id=None))
+        db.session.commit()
+        check_walks()
+        first = listing_order()[0]
+        assert db.session.get(Product, first).category_id is None
+
+@pytest.mark.parametrize('cursor', ['', 'nonsense', '1:2', 'a:b:c', '1:2:3:4'])
+def test_invalid_cursor_starts_over(app, cursor):
+    with app.app_context():
+        first = [product.id for product in product_listing(PER_PAGE).items]
+        assert [product.id for product in product_listing(PER_PAGE, after=cursor).items] == first
+        assert [product.id for product in product_listing(PER_PAGE, before=cursor).items] == first
+
+def test_cursor_round_trip(app):
+    with app.app_context():
+        page = product_listing(PER_PAGE)
+        last = page.items[-1]
+        assert page.next_cursor == cursor_for(last.category_id, last.price_cents, last.id)
@@ -0,0 +1,30 @@
+from app import db
+from app.catalog import ProductIdPool
+from app.models import Product, Category
+
+def ids(products):
+    return {product.id for product in products}
+
+def test_other_workers_see_a_product_added_after_the_newest_was_deleted(app):
+    # two pools stand for two workers: the first one deletes the newest product and later adds one, the second
+    # samples in between and drops the deleted id. Without AUTOINCREMENT SQLite gave the new product that same id,
+    # which is not above the second pool's max_id, so it never showed up there
+    with app.app_context():
+        first, second = ProductIdPool(), ProductIdPool()
+        first.load()
+        second.load()
+        newest = first.max_id
+        db.session.delete(db.session.get(Product, newest))
+        db.session.commit()
+        first.discard(newest)
+
+        assert newest not in ids(second.sample(len(second.ids)))
+        assert newest not in second.positions
+
+        product = Product('New lamp', '9.99', db.session.get(Category, 1), '', 'a lamp')
+        db.session.add(product)
+        db.session.commit()
+        first.add(product.id)
+
+        for pool in (first, second):
+            assert product.id in ids(pool.sample(len(pool.ids) + 1))
@@ -0,0 +1,30 @@
+import pytest
+from app import db
+from app.models import Cart, Product
+from app.testing import assert_request_queries
+from tests.conftest import logged_in
+
+# statement budgets for the main pages, counted on the first request with empty caches. A page that starts
+# loading categories, products or cart lines one by one again fails here. When a change really needs another
+# query, raise the number in the same commit and say why
+
+@pytest.mark.parametrize('url, viewer, expected', [
+    ('/', None, 0), # static landing page
+    ('/homepage', 2, 3), # session user, product id pool, sampled products with their categories
+    ('/products/1', None, 2), # one page with categories joined, the total count
+    ('/product/1', None, 1), # product with its category
+    ('/cart', 2, 3), # session user, cart, lines with products and the total
+    ('/admin/categories', 1, 2) # session user, categories with their stored product counts
+])
+def test_page_queries(app, url, viewer, expected):
+    client = logged_in(app, viewer) if viewer else app.test_client()
+    response = assert_request_queries(client, 'GET', url, expected)
+    assert response.status_code == 200
+
+def test_cart_queries_dont_grow_with_items(app, customer):
+    with app.app_context():
+        cart = Cart.query.filter_by(user_id=2).first()
+        cart.set_quantities({product_id: 1 for product_id, in db.session.query(Product.id).limit(40)})
+        db.session.commit()
+    response = assert_request_queries(customer, 'GET', '/cart', 3)
+    assert response.get_data(as_text=True).count('<tr') > 40
@@ -0,0 +1,32 @@
+import pytest
+from app.testing import assert_request_no_scans, table_scans
+from tests.conftest import logged_in
+
+# every statement of these requests goes through EXPLAIN QUERY PLAN, a full table scan fails the test.
+# allow names the tables a page is meant to read in full
+
+@pytest.mark.parametrize('url, viewer, allow', [
+    ('/homepage', 2, ('product',)), # the product id pool reads every id once per worker, then samples by primary key
+    # the page count is a COUNT over the listing index, cached for PRODUCT_COUNT_TTL
+    ('/products/1', None, ('product USING COVERING INDEX ix_product_listing',)),
+    ('/products/3', None, ('product USING COVERING INDEX ix_product_listing',)),
+    ('/product/1', None, ()),
+    ('/search?q=chair', None, ('category',)), # the category filter lists every category
+    ('/cart', 2, ())
+])
+def test_no_table_scans(app, url, viewer, allow):
+    client = logged_in(app, viewer) if viewer else app.test_client()
+    response = assert_request_no_scans(client, 'GET', url, allow=allow)
+    assert response.status_code == 200
+
+def test_scan_check_catches_a_missing_index(app):
+    # the check itself: a lookup on an unindexed column is reported
+    scans = table_scans([('SELECT id FROM product WHERE description = ?', ('bench',))], app)
+    assert scans and scans[0].startswith('SCAN product')
+
+def test_scan_check_catches_an_unbounded_index_walk(app):
+    # walking the listing index in order is fine for a page, the old listing read the whole table through it
+    listing = 'SELECT id, name, price_cents FROM product ORDER BY category_id, price_cents, id'
+    scans = table_scans([(listing, ())], app)
+    assert scans and scans[0].startswith('SCAN product USING INDEX ix_product_listing')
+    assert table_scans([(listing + ' LIMIT ?', (20,))], app) == []
@@ -0,0 +1,84 @@
+import pytest
+from app import db
+from app.models import Product, Category
+from app.search import search_products
+
+def found(text, **kwargs):
+    return [product.id for product in search_products(text, 100, **kwargs).items]
+
+def integrity_check():
+    # FTS5 compares the index with the product table and raises if they differ
+    db.session.execute(db.text("INSERT INTO product_search(product_search, rank) VALUES ('integrity-check', 1)"))
+
+def add(name, description='plain', category_id=1):
+    product = Product(name, '5.00', db.session.get(Category, category_id), '', description)
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+def test_triggers_follow_orm_writes(app):
+    with app.app_context():
+        product_id = add('Walnut armoire', 'hand waxed')
+        assert found('armoire') == [product_id]
+        assert found('waxed') == [product_id]
+
+        product = db.session.get(Product, product_id)
+        product.name = 'Oak wardrobe'
+        db.session.commit()
+        assert found('armoire') == []
+        assert found('wardrobe') == [product_id]
+
+        product.description = 'oiled'
+        db.session.commit()
+        assert found('waxed') == [] and found('oiled') == [product_id]
+
+        db.session.delete(product)
+        db.session.commit()
+        assert found('wardrobe') == []
+        integrity_check()
+
+def test_triggers_follow_core_writes(app):
+    # bulk writes like the catalog import skip the ORM, the triggers still see them
+    with app.app_context():
+        db.session.execute(db.insert(Product), [
+            {'name': f'Teak stool {i}', 'price_cents': 100, 'description': 'low', 'image_path': '', 'category_id': 1}
+            for i in range(3)
+        ])
+        db.session.commit()
+        ids = found('teak')
+        assert len(ids) == 3
+        db.session.execute(db.update(Product).where(Product.id == ids[0]).values(name='Pine stool'))
+        db.session.execute(db.delete(Product).where(Product.id == ids[1]))
+        db.session.commit()
+        assert found('teak') == [ids[2]]
+        assert found('pine') == [ids[0]]
+        integrity_check()
+
+@pytest.mark.parametrize('per_page', [1, 3, 4, 10])
+def test_cursor_pages_without_duplicates_or_gaps(app, per_page):
+    with app.app_context():
+        # equal names score the same, so pages break inside ties that only the id orders
+        for i in range(12):
+            add('Zebra rug' if i % 3 else f'Zebra zebra rug {i}', 'striped zebra' if i % 2 else 'striped', category_id=1 + i % 2)
+        everything = found('zebra')
+        assert len(everything) == 12
+        for category_id in (None, 2):
+            expected = found('zebra', category_id=category_id)
+            pages, after = [], None
+            while True:
+                page = search_products('zebra', per_page, category_id=category_id, after=after)
+                pages += [product.id for product in page.items]
+                if not page.has_next:
+                    break
+                after = page.next_cursor
+            assert pages == expected
+        assert len(set(everything)) == 12
+
+def test_search_input_is_not_fts_syntax(app):
+    with app.app_context():
+        product_id = add('Lamp NEAR window')
+        # operators, quotes and column filters are searched for as words
+        assert found('lamp NEAR') == [product_id]
+        assert found('NEAR(lamp "window")') == [product_id]
+        assert found('name:lamp') == []
+        assert found('***') == []